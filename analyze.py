@@ -0,0 +1,41 @@
+import argparse
+import json
+import sys
+import time
+
+from engine.analysis import analyze_fen, analyze_game, pipeline
+from engine.pgn import read_games
+
+
+def fen_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="check fen/epd positions or pgn games from a file, one json line out "
+                                                 "per position or game")
+    parser.add_argument("input", help="fen/epd or pgn file, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="json lines output, - for stdout")
+    parser.add_argument("--pgn", action="store_true", help="input is pgn (the default for .pgn files)")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="processes to fan the work out over")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", errors="replace")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    games = args.pgn or args.input.lower().endswith(".pgn")
+    items = read_games(source) if games else fen_lines(source)
+
+    count = positions = illegal = 0
+    start = time.perf_counter()
+    with source, target:
+        for record in pipeline(items, analyze_game if games else analyze_fen, args.workers):
+            target.write(json.dumps(record) + "\n")
+            count += 1
+            positions += record.get("plies", 0) + 1 if games else 1
+            illegal += not record["legal"]
+    elapsed = time.perf_counter() - start
+    print(f"{count} {'games' if games else 'positions'} ({illegal} illegal), {positions} positions in {elapsed:.3f}s, "
+          f"{int(positions / max(elapsed, 1e-9))} positions/s", file=sys.stderr)
@@ -0,0 +1,24 @@
+import argparse
+import time
+
+from data.archive import EXTENSION, AssetArchive, pack_assets
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pack sprite directories into one mmapped asset archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="write every file under a directory into <directory>.pcar")
+    pack.add_argument("directory")
+    pack.add_argument("-o", "--output", help=f"archive path, default the directory name plus {EXTENSION}")
+    show = commands.add_parser("list", help="print the names and sizes in an archive (or a loose directory)")
+    show.add_argument("archive")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        output = args.output or args.directory.rstrip("/\\") + EXTENSION
+        start = time.perf_counter()
+        count = pack_assets(args.directory, output)
+        print(f"{count} files packed into {output} in {time.perf_counter() - start:.2f}s")
+    else:
+        with AssetArchive(args.archive) as archive:
+            for name in archive.names():
+                print(f"{archive.size(name):>9}  {name}")
@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from engine.book import OpeningBook, build_book
+from engine.movegen import move_to_uci
+from engine.pgn import read_games
+from engine.rules import START_FEN, parse_fen
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build or look into polyglot opening books")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="make a book from a pgn collection")
+    build.add_argument("pgn")
+    build.add_argument("-o", "--output", default="book.bin")
+    build.add_argument("--plies", type=int, default=20, help="how deep into each game to take moves")
+    build.add_argument("--min-games", type=int, default=1, help="drop moves played in fewer games")
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book")
+    probe.add_argument("fen", nargs="?", default=START_FEN)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        with open(args.pgn, encoding="utf-8", errors="replace") as source:
+            count = build_book(read_games(source), args.output, args.plies, args.min_games)
+        print(f"{count} entries written to {args.output} in {time.perf_counter() - start:.3f}s")
+    else:
+        with OpeningBook(args.book) as book:
+            moves = book.moves(parse_fen(args.fen))
+        total = sum(weight for _, weight in moves) or 1
+        for move, weight in sorted(moves, key=lambda entry: -entry[1]):
+            print(f"{move_to_uci(move):<6} weight {weight:<6} {100 * weight / total:5.1f}%")
+        if not moves:
+            print("out of book")
@@ -0,0 +1,153 @@
+import io
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+MAGIC = b"PCAR"
+VERSION = 1
+HEADER = struct.Struct("<4sB3xI")  # magic, version, entry count
+ENTRY = struct.Struct("<IIH")  # offset from the start of the file, size, name length; the utf-8 name follows
+EXTENSION = ".pcar"
+IMAGE_TYPES = (".png", ".bmp", ".jpg", ".jpeg", ".gif", ".tga")
+
+
+def pack_assets(directory, path):
+    # every file under directory into one archive, named by its path relative to directory with / separators
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+        for name in sorted(names):
+            if not name.startswith(".") and not name.endswith(EXTENSION):
+                full = os.path.join(root, name)
+                files.append((os.path.relpath(full, directory).replace(os.sep, "/").encode(), full))
+    index = b""
+    offset = HEADER.size + sum(ENTRY.size + len(name) for name, _ in files)
+    for name, full in files:
+        size = os.path.getsize(full)
+        index += ENTRY.pack(offset, size, len(name)) + name
+        offset += size
+    with open(path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(files)) + index)
+        for _, full in files:
+            with open(full, "rb") as fp:
+                out.write(fp.read())
+    return len(files)
+
+
+class AssetArchive:
+    # named files out of one mmapped archive, or straight off disk when path is a directory (handy while editing
+    # sprites); images are decoded the first time they're asked for and kept
+    def __init__(self, path):
+        self.path = path
+        self.index = {}  # name -> (offset, size) in the archive, or the file's path for a directory
+        self.handle = None
+        self.data = None
+        self.surfaces = {}
+        self.pending = {}  # name -> future of the preload batch decoding it
+        self.pool = None
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    full = os.path.join(root, name)
+                    self.index[os.path.relpath(full, path).replace(os.sep, "/")] = full
+            return
+        self.handle = open(path, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not an asset archive")
+        offset = HEADER.size
+        for _ in range(count):
+            start, size, length = ENTRY.unpack_from(self.data, offset)
+            offset += ENTRY.size
+            self.index[self.data[offset:offset + length].decode()] = (start, size)
+            offset += length
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)  # waits for running decodes, they still read the mmap
+            self.pool = None
+        self.pending.clear()
+        if self.data is not None:
+            self.data.close()
+            self.handle.close()
+            self.data = self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self, prefix=""):
+        return sorted(name for name in self.index if name.startswith(prefix))
+
+    def size(self, name):
+        entry = self.index[name]
+        return os.path.getsize(entry) if self.data is None else entry[1]
+
+    def read(self, name):
+        entry = self.index[name]
+        if self.data is None:
+            with open(entry, "rb") as fp:
+                return fp.read()
+        start, size = entry
+        return self.data[start:start + size]
+
+    def _decode(self, name):
+        return pygame.image.load(io.BytesIO(self.read(name)), name)
+
+    def _decode_batch(self, names):
+        decoded = {}
+        for name in names:
+            try:
+                decoded[name] = self._decode(name)
+            except (pygame.error, OSError):
+                pass  # image() decodes it again and raises where the caller can see it
+        return decoded
+
+    def preload(self, names=None, workers=4):
+        # start decoding in a thread pool, image() picks the results up (or waits for them) when they're needed.
+        # no names means every image in the archive. the decoder holds the gil, so the win is overlapping it with
+        # window setup and cold reads rather than decoding in parallel; names go in batches to keep the pool
+        # overhead below the cost of the tiny sprites themselves
+        if names is None:
+            names = [name for name in self.index if name.lower().endswith(IMAGE_TYPES)]
+        names = [name for name in names if name not in self.surfaces and name not in self.pending]
+        if not names:
+            return
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(workers, thread_name_prefix="assets")
+        size = -(-len(names) // (workers * 4))
+        for i in range(0, len(names), size):
+            batch = names[i:i + size]
+            future = self.pool.submit(self._decode_batch, batch)
+            for name in batch:
+                self.pending[name] = future
+
+    def image(self, name):
+        # the shared surface for name, converted to the display format once there is a display
+        surface = self.surfaces.get(name)
+        if surface is None:
+            future = self.pending.pop(name, None)
+            surface = future.result().get(name) if future is not None else None
+            if surface is None:
+                surface = self._decode(name)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            self.surfaces[name] = surface
+        return surface
+
+
+def open_assets(path):
+    # path.pcar when it has been packed, otherwise the loose files in path
+    if os.path.exists(path + EXTENSION):
+        return AssetArchive(path + EXTENSION)
+    return AssetArchive(path)
@@ -155,12 +155,16 @@ class Entity:
         self.y = self.obj.rect.y
         return collisions
 
-    def load_anims(self, path, frame_amt, frame_time, mask=False):
+    def load_anims(self, path, frame_amt, frame_time, mask=False, archive=None):
+        # with an archive (data.archive.AssetArchive) path is a folder inside it instead of on disk
         name = path.split('/')[-1]
         frames = []
         mask_list = []
         for i in range(int(frame_amt)):
-            image = pygame.image.load(f"{path}/{name}_{i}.png").convert()
+            if archive is not None:
+                image = archive.image(f"{path}/{name}_{i}.png").copy()  # own copy, the colorkey is per entity
+            else:
+                image = pygame.image.load(f"{path}/{name}_{i}.png").convert()
             # make white transparent
             image.set_colorkey(self.color_key)
             if self.obj is None:  # if you want to load anims before the hitbox, assumes all frames have same dimensions
@@ -275,8 +279,11 @@ global particle_images
 particle_images = {}
 
 
-def load_particle_images(path):
+def load_particle_images(path, archive=None):
     global particle_images, e_colorkey
+    if archive is not None:
+        load_archived_particles(path, archive)
+        return
     file_list = os.listdir(path)
     for folder in file_list:
         try:
@@ -292,6 +299,22 @@ def load_particle_images(path):
             pass
 
 
+def load_archived_particles(path, archive):
+    # same layout as on disk (path/<type>/<frame number>.png) but read from the archive's index, no listdir
+    global particle_images, e_colorkey
+    prefix = path.strip('/') + '/' if path.strip('/') else ''
+    folders = {}
+    for name in archive.names(prefix):
+        folder, _, img = name[len(prefix):].partition('/')
+        if img[:-4].isdigit() and img.endswith('.png'):
+            folders.setdefault(folder, []).append((int(img[:-4]), name))
+    for folder, frames in folders.items():
+        images = [archive.image(name) for _, name in sorted(frames)]
+        for img in images:
+            img.set_colorkey(e_colorkey)
+        particle_images[folder] = images
+
+
 class Particle(ObjectEnt):
 
     def __init__(self, x, y, particle_type, motion, decay_rate, start_frame, width, height, custom_color=None):
@@ -0,0 +1,101 @@
+import itertools
+import multiprocessing
+
+from engine.movegen import CASTLING, KING_CASTLE, QUEEN_CASTLE, generate_legal_moves, in_check
+from engine.pgn import play, san_to_move
+from engine.rules import START_FEN, parse_fen, write_fen
+
+BACK_RANKS = 0xFF000000000000FF
+
+
+def position_errors(board):
+    # reasons the position could never come up in a game, empty when it is fine
+    errors = []
+    pieces = board.bitboards.pieces
+    for color in ("white", "black"):
+        kings = bin(pieces[color]["king"]).count("1")
+        if kings != 1:
+            errors.append(f"{color} has {kings} kings")
+        if bin(pieces[color]["pawn"]).count("1") > 8 or bin(board.bitboards.occupied[color]).count("1") > 16:
+            errors.append(f"{color} has too many pieces")
+    if (pieces["white"]["pawn"] | pieces["black"]["pawn"]) & BACK_RANKS:
+        errors.append("pawn on the first or last rank")
+    if errors:
+        return errors  # the rest needs one king a side
+
+    if in_check(board, "black" if board.turn == "white" else "white"):
+        errors.append("side not to move is in check")
+    for color in ("white", "black"):
+        for side, flag in enumerate((KING_CASTLE, QUEEN_CASTLE)):
+            king_sq, _, rook_sq = CASTLING[(color, flag)][:3]
+            if board.castle[color == "black"][side] and not (pieces[color]["king"] >> king_sq & 1 and
+                                                             pieces[color]["rook"] >> rook_sq & 1):
+                errors.append(f"{color} castling right without king and rook at home")
+    target = board.en_passant[0]
+    if target:
+        # the pawn that just pushed two sits past the target, the target and the square it left are empty
+        file, rank = target
+        step = -1 if board.turn == "white" else 1
+        enemy = "black" if board.turn == "white" else "white"
+        if rank != (5 if board.turn == "white" else 2) or not pieces[enemy]["pawn"] >> ((rank + step) * 8 + file) & 1 \
+                or board.bitboards.all & (1 << rank * 8 + file | 1 << (rank - step) * 8 + file):
+            errors.append("impossible en passant square")
+    return errors
+
+
+def describe(board):
+    moves = list(generate_legal_moves(board))
+    check = in_check(board)
+    status = ("checkmate" if check else "stalemate") if not moves else ""
+    return {"check": check, "moves": len(moves), "status": status}
+
+
+def analyze_fen(line):
+    # one fen or epd line -> result record
+    fen = line.strip()
+    try:
+        board = parse_fen(fen)
+    except ValueError as error:
+        return {"fen": fen, "legal": False, "errors": [str(error)]}
+    errors = position_errors(board)
+    record = {"fen": fen, "legal": not errors, "errors": errors}
+    if not errors:
+        record.update(describe(board))
+    return record
+
+
+def analyze_game(game):
+    # (tags, san moves) from read_games -> result record, checked move by move
+    tags, moves = game
+    record = {key: tags[key] for key in ("Event", "White", "Black", "Result") if key in tags}
+    try:
+        board = parse_fen(tags.get("FEN", START_FEN))
+    except ValueError as error:
+        record.update(legal=False, plies=0, errors=[str(error)])
+        return record
+    errors = position_errors(board)
+    plies = 0
+    if not errors:
+        for san in moves:
+            try:
+                play(board, san_to_move(board, san))
+            except ValueError as error:
+                errors.append(f"ply {plies + 1}: {error}")
+                break
+            plies += 1
+    record.update(legal=not errors, plies=plies, errors=errors, fen=write_fen(board))
+    if not errors:
+        record.update(describe(board))
+    return record
+
+
+def pipeline(items, work, workers=1, chunk_size=256):
+    # lazily map work over items, in order; with workers > 1 a pool takes bounded batches so input is never
+    # read further ahead than the pool can chew
+    if workers <= 1:
+        yield from map(work, items)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        items = iter(items)
+        while batch := list(itertools.islice(items, chunk_size * workers * 4)):
+            yield from pool.imap(work, batch, chunk_size)
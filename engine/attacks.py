@@ -0,0 +1,56 @@
+from engine.bitboard import BETWEEN, CODE_COLORS, CODE_TYPES, attacks, bishop_attacks, iter_bits, rook_attacks
+
+
+class AttackMaps:
+    # per square attack sets plus the union for each colour, patched after every move instead of rebuilt
+    def __init__(self):
+        self.from_square = [0] * 64
+        self.maps = {"white": 0, "black": 0}
+
+    def refresh(self, bitboards):
+        occupied = bitboards.all
+        cells = bitboards.cells
+        for sq in range(64):
+            code = cells[sq]
+            self.from_square[sq] = attacks(CODE_TYPES[code], CODE_COLORS[code], sq, occupied) if code else 0
+        self._rebuild(bitboards)
+
+    def update(self, bitboards, changed):
+        # changed: mask of every square whose contents differ, only those pieces and the sliders that see them move
+        occupied = bitboards.all
+        cells = bitboards.cells
+        from_square = self.from_square
+        for sq in iter_bits(changed):
+            code = cells[sq]
+            from_square[sq] = attacks(CODE_TYPES[code], CODE_COLORS[code], sq, occupied) if code else 0
+        for color in ("white", "black"):
+            pieces = bitboards.pieces[color]
+            for sq in iter_bits((pieces["bishop"] | pieces["rook"] | pieces["queen"]) & ~changed):
+                if from_square[sq] & changed:
+                    from_square[sq] = attacks(CODE_TYPES[cells[sq]], color, sq, occupied)
+        self._rebuild(bitboards)
+
+    def _rebuild(self, bitboards):
+        from_square = self.from_square
+        for color in ("white", "black"):
+            attacked = 0
+            for sq in iter_bits(bitboards.occupied[color]):
+                attacked |= from_square[sq]
+            self.maps[color] = attacked
+
+    def is_attacked(self, sq, color):
+        return self.maps[color] >> sq & 1 == 1
+
+
+def pinned_pieces(bitboards, color, king_sq):
+    enemy = "black" if color == "white" else "white"
+    their = bitboards.pieces[enemy]
+    their_occupied = bitboards.occupied[enemy]
+    snipers = ((rook_attacks(king_sq, their_occupied) & (their["rook"] | their["queen"])) |
+               (bishop_attacks(king_sq, their_occupied) & (their["bishop"] | their["queen"])))
+    pinned = 0
+    for sniper in iter_bits(snipers):
+        blockers = BETWEEN[king_sq * 64 + sniper] & bitboards.all
+        if blockers and not blockers & (blockers - 1) and blockers & bitboards.occupied[color]:
+            pinned |= blockers
+    return pinned
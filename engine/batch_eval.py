@@ -0,0 +1,136 @@
+import numpy as np
+
+from engine.bitboard import COLORS, DIRECTIONS, PIECE_TYPES
+from engine.evaluate import SQUARE_SCORES
+
+# planes 0-5 are the white pieces in PIECE_TYPES order, 6-11 the black ones, bit n of a plane is square n
+PLANES = [(color, ptype) for color in COLORS for ptype in PIECE_TYPES]
+PLANE_INDEX = {key: index for index, key in enumerate(PLANES)}
+
+MOBILITY_WEIGHTS = {"pawn": 0, "knight": 4, "bishop": 5, "rook": 2, "queen": 1, "king": 0}
+DOUBLED_PAWN = -15
+ISOLATED_PAWN = -12
+PASSED_PAWN = (0, 5, 10, 20, 35, 60, 100, 0)  # by rank, from the pawn's own side
+
+# material + piece square per plane, black planes negated so one dot product gives white's score
+WEIGHTS = np.array([[SQUARE_SCORES[color][ptype][sq] * (1 if color == "white" else -1) for sq in range(64)]
+                    for color, ptype in PLANES], dtype=np.int32)
+
+FILE_A = 0x0101010101010101
+NOT_FILE = {df: 0xFFFFFFFFFFFFFFFF & ~sum(FILE_A << f for f in range(8) if not 0 <= f - df < 8) for df in range(-2, 3)}
+KNIGHT_STEPS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+KING_STEPS = DIRECTIONS
+
+popcount = getattr(np, "bitwise_count", None)
+if popcount is None:  # numpy < 2
+    def popcount(words):
+        return np.unpackbits(words[..., None].view(np.uint8), axis=-1).sum(axis=-1)
+
+
+def _raw_shift(words, step):
+    return words << np.uint64(step) if step > 0 else words >> np.uint64(-step)
+
+
+def _shift(words, df, dr):
+    # move every bit by (df, dr), dropping what falls off the board or wraps round a side
+    return _raw_shift(words, dr * 8 + df) & np.uint64(NOT_FILE[df])
+
+
+def _slide(sliders, empty, df, dr):
+    # kogge-stone fill: every square the sliders reach in one direction, including the first blocker
+    step = dr * 8 + df
+    empty = empty & np.uint64(NOT_FILE[df])
+    for hop in (step, step * 2, step * 4):
+        sliders = sliders | empty & _raw_shift(sliders, hop)
+        empty = empty & _raw_shift(empty, hop)
+    return _shift(sliders, df, dr)
+
+
+def encode(boards):
+    # boards -> (n, 12) little endian uint64 bitboard words, one per plane
+    data = b"".join(board.bitboards.pieces[color][ptype].to_bytes(8, "little")
+                    for board in boards for color, ptype in PLANES)
+    return np.frombuffer(data, dtype="<u8").reshape(-1, 12)
+
+
+def unpack(words):
+    # (n, 12) words -> (n, 12, 64) 0/1 planes
+    words = np.ascontiguousarray(words, dtype="<u8")
+    return np.unpackbits(words.view(np.uint8), axis=-1, bitorder="little").reshape(len(words), 12, 64)
+
+
+def pack(planes):
+    return np.packbits(np.asarray(planes, dtype=np.uint8), axis=-1, bitorder="little").view("<u8").reshape(-1, 12)
+
+
+def _pawn_structure(pawns, enemy_pawns):
+    # pawns: (n, 8, 8) indexed [rank][file], already flipped so the pawns advance up the ranks
+    per_file = pawns.sum(axis=1)
+    doubled = np.maximum(per_file - 1, 0).sum(axis=1)
+    has_pawn = per_file > 0
+    neighbours = np.zeros_like(has_pawn)
+    neighbours[:, 1:] |= has_pawn[:, :-1]
+    neighbours[:, :-1] |= has_pawn[:, 1:]
+    isolated = (per_file * ~neighbours).sum(axis=1)
+
+    # enemy pawns that can stop or take a pawn: same or adjacent file, any rank ahead
+    span = enemy_pawns.astype(bool)
+    span[:, :, 1:] |= enemy_pawns[:, :, :-1].astype(bool)
+    span[:, :, :-1] |= enemy_pawns[:, :, 1:].astype(bool)
+    ahead = np.flip(np.logical_or.accumulate(np.flip(span, axis=1), axis=1), axis=1)
+    ahead = np.concatenate([ahead[:, 1:], np.zeros_like(ahead[:, :1])], axis=1)
+    passed = pawns * ~ahead
+    passed_score = (passed.sum(axis=2) * np.array(PASSED_PAWN, dtype=np.int32)).sum(axis=1)
+    return doubled * DOUBLED_PAWN + isolated * ISOLATED_PAWN + passed_score
+
+
+def _mobility(words, color_index):
+    # pseudo legal moves per piece type, one direction at a time so every move is counted exactly once
+    own_planes = words[:, color_index * 6:color_index * 6 + 6]
+    free = ~np.bitwise_or.reduce(own_planes, axis=1)
+    empty = ~np.bitwise_or.reduce(words, axis=1)
+    total = np.zeros(len(words), dtype=np.int32)
+    for index, ptype in enumerate(PIECE_TYPES):
+        weight = MOBILITY_WEIGHTS[ptype]
+        if not weight:
+            continue
+        pieces = own_planes[:, index]
+        match ptype:
+            case "knight" | "king":
+                for df, dr in KNIGHT_STEPS if ptype == "knight" else KING_STEPS:
+                    total += popcount(_shift(pieces, df, dr) & free).astype(np.int32) * weight
+            case _:
+                directions = {"bishop": DIRECTIONS[4:], "rook": DIRECTIONS[:4]}.get(ptype, DIRECTIONS)
+                for df, dr in directions:
+                    total += popcount(_slide(pieces, empty, df, dr) & free).astype(np.int32) * weight
+    return total
+
+
+def evaluate_batch(positions, turns=None):
+    # positions: boards, (n, 12) bitboard words or (n, 12, 64) planes; turns: "white"/"black" per position
+    # returns int32 centipawns from the side to move's view (white's view when no turns are given for arrays)
+    if len(positions) == 0:
+        return np.zeros(0, dtype=np.int32)  # an empty list has no shape to tell words from planes
+    if hasattr(positions[0], "bitboards"):
+        if turns is None:
+            turns = [board.turn for board in positions]
+        words = encode(positions)
+        planes = unpack(words)
+    else:
+        array = np.asarray(positions)
+        words, planes = (array, unpack(array)) if array.ndim == 2 else (pack(array), array)
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    n = len(words)
+
+    score = planes.reshape(n, 768).astype(np.int32) @ WEIGHTS.reshape(768)
+    score += _mobility(words, 0) - _mobility(words, 1)
+
+    pawn_index = PIECE_TYPES.index("pawn")
+    white_pawns = planes[:, pawn_index].reshape(n, 8, 8).astype(np.int32)
+    black_pawns = planes[:, 6 + pawn_index].reshape(n, 8, 8).astype(np.int32)
+    score += _pawn_structure(white_pawns, black_pawns)
+    score -= _pawn_structure(black_pawns[:, ::-1], white_pawns[:, ::-1])
+
+    if turns is not None:
+        score = np.where(np.asarray(turns) == "black", -score, score)
+    return score.astype(np.int32)
@@ -0,0 +1,227 @@
+# squares are numbered rank * 8 + file, so a1 = 0, h1 = 7, a8 = 56, h8 = 63
+# positions elsewhere in the code are (file, rank) tuples, same as Piece.pos
+
+PIECE_TYPES = ("pawn", "knight", "bishop", "rook", "queen", "king")
+COLORS = ("white", "black")
+PIECE_BITS = {ptype: 1 << index for index, ptype in enumerate(PIECE_TYPES)}  # for CONNECTS masks
+
+# one byte per square in BitBoards.cells: 0 empty, otherwise colour index * 8 + type index + 1
+PIECE_CODES = {(color, ptype): c * 8 + t + 1 for c, color in enumerate(COLORS) for t, ptype in enumerate(PIECE_TYPES)}
+CODE_TYPES = [None] * 16
+CODE_COLORS = [None] * 16
+for (color, ptype), code in PIECE_CODES.items():
+    CODE_TYPES[code] = ptype
+    CODE_COLORS[code] = color
+
+# (file, rank) steps, the first four are the rook directions and the last four the bishop ones
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1))
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+POSITIVE = (True, False, True, False, True, False, False, True)  # does the square index go up along the ray
+
+
+def square(pos):
+    return pos[1] * 8 + pos[0]
+
+
+def square_pos(sq):
+    return sq & 7, sq >> 3
+
+
+def bit(pos):
+    return 1 << (pos[1] * 8 + pos[0])
+
+
+def iter_bits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def _step_table(steps):
+    table = []
+    for sq in range(64):
+        file, rank = sq & 7, sq >> 3
+        mask = 0
+        for df, dr in steps:
+            if 0 <= file + df < 8 and 0 <= rank + dr < 8:
+                mask |= 1 << ((rank + dr) * 8 + file + df)
+        table.append(mask)
+    return table
+
+
+def _ray_table(df, dr):
+    table = []
+    for sq in range(64):
+        file, rank = (sq & 7) + df, (sq >> 3) + dr
+        mask = 0
+        while 0 <= file < 8 and 0 <= rank < 8:
+            mask |= 1 << (rank * 8 + file)
+            file += df
+            rank += dr
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table(((2, 1), (2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2), (-2, 1), (-2, -1)))
+KING_ATTACKS = _step_table(((1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1)))
+PAWN_ATTACKS = {
+    "white": _step_table(((1, 1), (-1, 1))),
+    "black": _step_table(((1, -1), (-1, -1)))
+}
+RAYS = [_ray_table(df, dr) for df, dr in DIRECTIONS]
+
+
+def _pair_tables():
+    # one entry per (start, end) at start * 64 + end: direction index (-1 off any line), king distance, squares
+    # strictly between (0 off a line), and PIECE_BITS of every piece type with a move or capture from start to end
+    # on some board (pawns of either colour, kings counting the two square castling step)
+    line = [-1] * 4096
+    distance = bytearray(4096)
+    between_masks = [0] * 4096
+    connects = bytearray(4096)
+    for start in range(64):
+        for end in range(64):
+            index = start * 64 + end
+            df, dr = (end & 7) - (start & 7), (end >> 3) - (start >> 3)
+            distance[index] = max(abs(df), abs(dr))
+            if start == end:
+                continue
+            pieces = 0
+            if df == 0 or dr == 0 or abs(df) == abs(dr):
+                d = DIRECTIONS.index(((df > 0) - (df < 0), (dr > 0) - (dr < 0)))
+                line[index] = d
+                between_masks[index] = (RAYS[d][start] ^ RAYS[d][end]) & ~(1 << end)
+                pieces |= PIECE_BITS["queen"] | PIECE_BITS["rook" if d in ROOK_DIRECTIONS else "bishop"]
+            if KNIGHT_ATTACKS[start] >> end & 1:
+                pieces |= PIECE_BITS["knight"]
+            if distance[index] == 1 or (abs(df) == 2 and dr == 0):
+                pieces |= PIECE_BITS["king"]
+            if (abs(df) <= 1 and abs(dr) == 1) or (df == 0 and abs(dr) == 2):
+                pieces |= PIECE_BITS["pawn"]
+            connects[index] = pieces
+    return line, distance, between_masks, connects
+
+
+LINE, DISTANCE, BETWEEN, CONNECTS = _pair_tables()
+
+
+def ray_attacks(sq, occupied, direction):
+    ray = RAYS[direction][sq]
+    blockers = ray & occupied
+    if blockers:
+        if POSITIVE[direction]:
+            first = (blockers & -blockers).bit_length() - 1
+        else:
+            first = blockers.bit_length() - 1
+        ray ^= RAYS[direction][first]
+    return ray
+
+
+def rook_attacks(sq, occupied):
+    return (ray_attacks(sq, occupied, 0) | ray_attacks(sq, occupied, 1) |
+            ray_attacks(sq, occupied, 2) | ray_attacks(sq, occupied, 3))
+
+
+def bishop_attacks(sq, occupied):
+    return (ray_attacks(sq, occupied, 4) | ray_attacks(sq, occupied, 5) |
+            ray_attacks(sq, occupied, 6) | ray_attacks(sq, occupied, 7))
+
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+def attacks(ptype, color, sq, occupied):
+    match ptype:
+        case "pawn":
+            return PAWN_ATTACKS[color][sq]
+        case "knight":
+            return KNIGHT_ATTACKS[sq]
+        case "bishop":
+            return bishop_attacks(sq, occupied)
+        case "rook":
+            return rook_attacks(sq, occupied)
+        case "queen":
+            return queen_attacks(sq, occupied)
+        case "king":
+            return KING_ATTACKS[sq]
+    return 0
+
+
+def direction(start, end):
+    d = LINE[start * 64 + end]
+    return None if d < 0 else d
+
+
+def between(start, end):
+    return BETWEEN[start * 64 + end]
+
+
+class BitBoards:
+    def __init__(self):
+        self.pieces = {color: dict.fromkeys(PIECE_TYPES, 0) for color in COLORS}
+        self.occupied = {"white": 0, "black": 0}
+        self.all = 0
+        self.cells = bytearray(64)  # piece code on each square, see PIECE_CODES
+
+    def clear(self):
+        for color in COLORS:
+            for ptype in PIECE_TYPES:
+                self.pieces[color][ptype] = 0
+            self.occupied[color] = 0
+        self.all = 0
+        self.cells = bytearray(64)
+
+    def type_at(self, sq):
+        return CODE_TYPES[self.cells[sq]]
+
+    def add(self, ptype, color, sq):
+        mask = 1 << sq
+        self.pieces[color][ptype] |= mask
+        self.occupied[color] |= mask
+        self.all |= mask
+        self.cells[sq] = PIECE_CODES[(color, ptype)]
+
+    def remove(self, ptype, color, sq):
+        mask = ~(1 << sq)
+        self.pieces[color][ptype] &= mask
+        self.occupied[color] &= mask
+        self.all &= mask
+        self.cells[sq] = 0
+
+    def move(self, ptype, color, start, end):
+        self.remove(ptype, color, start)
+        self.add(ptype, color, end)
+
+    def toggle(self, ptype, color, mask):  # flips bits without touching self.cells, for quick probes
+        self.pieces[color][ptype] ^= mask
+        self.occupied[color] ^= mask
+        self.all ^= mask
+
+    def color_at(self, sq):
+        if self.occupied["white"] >> sq & 1:
+            return "white"
+        if self.occupied["black"] >> sq & 1:
+            return "black"
+        return None
+
+    def attackers(self, sq, color, occupied=None):
+        if occupied is None:
+            occupied = self.all
+        pieces = self.pieces[color]
+        other = "black" if color == "white" else "white"
+        diagonal = pieces["bishop"] | pieces["queen"]
+        straight = pieces["rook"] | pieces["queen"]
+        return ((PAWN_ATTACKS[other][sq] & pieces["pawn"]) |
+                (KNIGHT_ATTACKS[sq] & pieces["knight"]) |
+                (KING_ATTACKS[sq] & pieces["king"]) |
+                (bishop_attacks(sq, occupied) & diagonal if diagonal else 0) |
+                (rook_attacks(sq, occupied) & straight if straight else 0))
+
+    def is_attacked(self, sq, color, occupied=None):
+        return self.attackers(sq, color, occupied) != 0
+
+    def path_clear(self, start, end, ignore=0):
+        return not (BETWEEN[square(start) * 64 + square(end)] & self.all & ~ignore)
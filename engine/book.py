@@ -0,0 +1,92 @@
+import mmap
+import os
+import random
+import struct
+
+from engine.movegen import generate_legal_moves
+from engine.pgn import play, san_to_move
+from engine.polyglot import decode_polyglot_move, encode_polyglot_move, polyglot_key
+from engine.rules import START_FEN, parse_fen
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn; entries sorted by key
+
+
+class OpeningBook:
+    # a polyglot .bin read through mmap, lookups binary search the sorted keys so nothing is loaded up front
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.count = len(self.data) // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entries(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.count:
+            entry = ENTRY.unpack_from(self.data, low * ENTRY.size)
+            if entry[0] != key:
+                break
+            yield entry
+            low += 1
+
+    def moves(self, board):
+        # (move, weight) for every book move that is legal here, zero weight entries are kept but never picked
+        legal = list(generate_legal_moves(board))
+        found = []
+        for _, book_move, weight, _ in self.entries(polyglot_key(board)):
+            move = decode_polyglot_move(book_move, legal)
+            if move is not None:
+                found.append((move, weight))
+        return found
+
+    def choose(self, board, rng=random, best=False):
+        # weighted random book move, or the heaviest with best=True; 0 when out of book
+        found = [(move, weight) for move, weight in self.moves(board) if weight]
+        if not found:
+            return 0
+        if best:
+            return max(found, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, _ in found], [weight for _, weight in found])[0]
+
+
+def build_book(games, path, max_plies=20, min_games=1):
+    # games from read_games; each move scores 2 for a win and 1 for a draw for the side that played it
+    scores = {}
+    seen = {}
+    for tags, moves in games:
+        result = tags.get("Result", "*")
+        try:
+            board = parse_fen(tags.get("FEN", START_FEN))
+            for san in moves[:max_plies]:
+                move = san_to_move(board, san)
+                entry = (polyglot_key(board), encode_polyglot_move(move))
+                won = result == ("1-0" if board.turn == "white" else "0-1")
+                scores[entry] = scores.get(entry, 0) + (2 if won else 1 if result == "1/2-1/2" else 0)
+                seen[entry] = seen.get(entry, 0) + 1
+                play(board, move)
+        except ValueError:
+            continue  # broken game, keep what it gave up to the bad move
+
+    kept = sorted(entry for entry, count in seen.items() if count >= min_games)
+    top = max((scores[entry] for entry in kept), default=0)
+    scale = 65535 / top if top > 65535 else 1
+    with open(path, "wb") as out:
+        for key, move in kept:
+            # a move that was played but never scored still gets weight 1 so it stays in the book
+            out.write(ENTRY.pack(key, move, max(int(scores[(key, move)] * scale), 1), 0))
+    return len(kept)
@@ -0,0 +1,286 @@
+from engine.attacks import pinned_pieces
+from engine.bitboard import (BETWEEN, CODE_TYPES, KING_ATTACKS, KNIGHT_ATTACKS, LINE, PAWN_ATTACKS, RAYS,
+                             bishop_attacks, iter_bits, queen_attacks, rook_attacks, square, square_pos)
+from engine.zobrist import CASTLE_KEYS, PIECE_KEYS, TURN_KEY, en_passant_key
+
+# moves are plain ints: start square in bits 0-5, end square in bits 6-11, flag in bits 12-15
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8  # | CAPTURE for capturing promotions, low two bits pick the piece
+PROMOTION_TYPES = ("knight", "bishop", "rook", "queen")
+
+# king start, king end, rook start, rook end, squares that must be empty, squares that must not be attacked
+CASTLING = {
+    ("white", KING_CASTLE): (4, 6, 7, 5, (5, 6), (4, 5, 6)),
+    ("white", QUEEN_CASTLE): (4, 2, 0, 3, (1, 2, 3), (4, 3, 2)),
+    ("black", KING_CASTLE): (60, 62, 63, 61, (61, 62), (60, 61, 62)),
+    ("black", QUEEN_CASTLE): (60, 58, 56, 59, (57, 58, 59), (60, 59, 58))
+}
+
+
+def encode_move(start, end, flag=QUIET):
+    return start | end << 6 | flag << 12
+
+
+def move_start(move):
+    return move & 63
+
+
+def move_end(move):
+    return move >> 6 & 63
+
+
+def move_flag(move):
+    return move >> 12
+
+
+def is_capture(move):
+    return move >> 14 & 1 == 1
+
+
+def promotion_type(move):
+    if move >> 15:
+        return PROMOTION_TYPES[move >> 12 & 3]
+    return None
+
+
+def move_to_uci(move):
+    start, end = square_pos(move & 63), square_pos(move >> 6 & 63)
+    text = f"{chr(ord('a') + start[0])}{start[1] + 1}{chr(ord('a') + end[0])}{end[1] + 1}"
+    promo = promotion_type(move)
+    if promo is not None:
+        text += "n" if promo == "knight" else promo[0]
+    return text
+
+
+def move_from_uci(board, text):
+    for move in generate_legal_moves(board):
+        if move_to_uci(move) == text:
+            return move
+    return None
+
+
+def has_legal_move(board):
+    # stops at the first legal move found, all mate and stalemate detection needs
+    return next(generate_legal_moves(board), None) is not None
+
+
+def en_passant_square(board):
+    target = board.en_passant[0]
+    return square(target) if target else None
+
+
+def _safe(bitboards, color, enemy, ptype, start, end, king_sq, captured=None, capture_sq=None):
+    # play the move on the bitboards only, ask whether the king is attacked, then flip it straight back
+    mask = 1 << start | 1 << end
+    bitboards.toggle(ptype, color, mask)
+    if captured is not None:
+        bitboards.toggle(captured, enemy, 1 << capture_sq)
+    safe = not bitboards.attackers(end if ptype == "king" else king_sq, enemy)
+    if captured is not None:
+        bitboards.toggle(captured, enemy, 1 << capture_sq)
+    bitboards.toggle(ptype, color, mask)
+    return safe
+
+
+def in_check(board, color=None):
+    color = board.turn if color is None else color
+    enemy = "black" if color == "white" else "white"
+    return board.attacks.maps[enemy] & board.bitboards.pieces[color]["king"] != 0
+
+
+def generate_legal_moves(board, captures_only=False):
+    # captures_only keeps captures, en passant and promotions, for quiescence search
+    bitboards = board.bitboards
+    color = board.turn
+    enemy = "black" if color == "white" else "white"
+    pieces = bitboards.pieces[color]
+    if not pieces["king"]:
+        return
+    king_sq = pieces["king"].bit_length() - 1
+    own = bitboards.occupied[color]
+    their = bitboards.occupied[enemy]
+    occupied = bitboards.all
+    cells = bitboards.cells
+    types = CODE_TYPES
+
+    # everything but the king is held to a mask: a single check is answered by taking the checker or stepping in
+    # between, a double one only by the king, and a pinned piece stays on its king's line (the full LINE/RAYS ray
+    # out of the king, the slider's own attacks stop it at the pinner)
+    enemy_map = board.attacks.maps[enemy]
+    checked = enemy_map >> king_sq & 1
+    evade = -1
+    if checked:
+        checkers = bitboards.attackers(king_sq, enemy)
+        evade = 0 if checkers & (checkers - 1) else checkers | BETWEEN[king_sq * 64 + checkers.bit_length() - 1]
+    pinned = pinned_pieces(bitboards, color, king_sq)
+    king_line = king_sq * 64
+    reachable = their if captures_only else ~own
+
+    for ptype in ("knight", "bishop", "rook", "queen"):
+        for start in iter_bits(pieces[ptype]):
+            match ptype:
+                case "knight":
+                    targets = KNIGHT_ATTACKS[start]
+                case "bishop":
+                    targets = bishop_attacks(start, occupied)
+                case "rook":
+                    targets = rook_attacks(start, occupied)
+                case _:
+                    targets = queen_attacks(start, occupied)
+            targets &= reachable & evade
+            if pinned >> start & 1:
+                targets &= RAYS[LINE[king_line + start]][king_sq]
+            for end in iter_bits(targets):
+                yield encode_move(start, end, CAPTURE if their >> end & 1 else QUIET)
+
+    for end in iter_bits(KING_ATTACKS[king_sq] & reachable & ~enemy_map):
+        # the map is exact unless the king is in check, where it can hide squares behind the king
+        if their >> end & 1:
+            if not checked or _safe(bitboards, color, enemy, "king", king_sq, end, king_sq, types[cells[end]], end):
+                yield encode_move(king_sq, end, CAPTURE)
+        elif not checked or _safe(bitboards, color, enemy, "king", king_sq, end, king_sq):
+            yield encode_move(king_sq, end)
+
+    forward = 8 if color == "white" else -8
+    last_rank = 7 if color == "white" else 0
+    double_rank = 1 if color == "white" else 6
+    for start in iter_bits(pieces["pawn"]):
+        allowed = evade
+        if pinned >> start & 1:
+            allowed &= RAYS[LINE[king_line + start]][king_sq]
+        end = start + forward
+        if not occupied >> end & 1:
+            if end >> 3 == last_rank:
+                if allowed >> end & 1:
+                    for promo in range(4):
+                        yield encode_move(start, end, PROMOTION | promo)
+            elif not captures_only:
+                if allowed >> end & 1:
+                    yield encode_move(start, end)
+                double = end + forward
+                if start >> 3 == double_rank and not occupied >> double & 1 and allowed >> double & 1:
+                    yield encode_move(start, double, DOUBLE_PUSH)
+        for end in iter_bits(PAWN_ATTACKS[color][start] & their & allowed):
+            if end >> 3 == last_rank:
+                for promo in range(4):
+                    yield encode_move(start, end, PROMOTION | CAPTURE | promo)
+            else:
+                yield encode_move(start, end, CAPTURE)
+
+    target = en_passant_square(board)
+    if target is not None and not occupied >> target & 1:
+        captured = target - forward
+        if types[cells[captured]] == "pawn" and their >> captured & 1:
+            for start in iter_bits(PAWN_ATTACKS[enemy][target] & pieces["pawn"]):
+                if _safe(bitboards, color, enemy, "pawn", start, target, king_sq, "pawn", captured):
+                    yield encode_move(start, target, EN_PASSANT)
+
+    if checked or captures_only:
+        return
+    rights = board.castle[color == "black"]
+    for flag, allowed in ((KING_CASTLE, rights[0]), (QUEEN_CASTLE, rights[1])):
+        if not allowed:
+            continue
+        king_start, king_end, rook_start, rook_end, empty, safe = CASTLING[(color, flag)]
+        if king_sq != king_start or not pieces["rook"] >> rook_start & 1:
+            continue
+        if any(occupied >> sq & 1 for sq in empty):
+            continue
+        if any(enemy_map >> sq & 1 for sq in safe):
+            continue
+        yield encode_move(king_start, king_end, flag)
+
+
+# squares whose rook or king leaving (or being captured) clears castling rights, as (colour index, side index)
+CASTLE_RIGHTS = {
+    4: ((0, 0), (0, 1)),
+    7: ((0, 0),),
+    0: ((0, 1),),
+    60: ((1, 0), (1, 1)),
+    63: ((1, 0),),
+    56: ((1, 1),)
+}
+
+
+def push_move(board, move):
+    # plays a move on the rules state only (bitboards, attack maps, zobrist key, turn, castling, en passant),
+    # returns what pop_move needs
+    bitboards = board.bitboards
+    color = board.turn
+    enemy = "black" if color == "white" else "white"
+    start, end, flag = move & 63, move >> 6 & 63, move >> 12
+    ptype = CODE_TYPES[bitboards.cells[start]]
+    new_type = PROMOTION_TYPES[flag & 3] if flag & PROMOTION else ptype
+    key = board.zobrist ^ TURN_KEY ^ PIECE_KEYS[color][ptype][start] ^ PIECE_KEYS[color][new_type][end]
+    if board.en_passant[0]:
+        key ^= en_passant_key(bitboards, color, board.en_passant[0])  # taken out against the pawns it went in with
+
+    captured = None
+    changed = 1 << start | 1 << end
+    if flag == EN_PASSANT:
+        captured = "pawn"
+        capture_sq = end - 8 if color == "white" else end + 8
+        bitboards.remove("pawn", enemy, capture_sq)
+        changed |= 1 << capture_sq
+        key ^= PIECE_KEYS[enemy]["pawn"][capture_sq]
+    elif flag & CAPTURE:
+        captured = CODE_TYPES[bitboards.cells[end]]
+        bitboards.remove(captured, enemy, end)
+        key ^= PIECE_KEYS[enemy][captured][end]
+    undo = (ptype, captured, (board.castle[0][:], board.castle[1][:]), board.en_passant, board.zobrist)
+
+    bitboards.remove(ptype, color, start)
+    bitboards.add(new_type, color, end)
+    if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+        rook_start, rook_end = CASTLING[(color, flag)][2:4]
+        bitboards.move("rook", color, rook_start, rook_end)
+        changed |= 1 << rook_start | 1 << rook_end
+        key ^= PIECE_KEYS[color]["rook"][rook_start] ^ PIECE_KEYS[color]["rook"][rook_end]
+    board.attacks.update(bitboards, changed)
+
+    for sq in (start, end):
+        for side, index in CASTLE_RIGHTS.get(sq, ()):
+            if board.castle[side][index]:
+                board.castle[side][index] = False
+                key ^= CASTLE_KEYS[side][index]
+    if flag == DOUBLE_PUSH:
+        board.en_passant = (list(square_pos((start + end) // 2)), None)
+        key ^= en_passant_key(bitboards, enemy, board.en_passant[0])
+    else:
+        board.en_passant = ([], None)
+    board.turn = enemy
+    board.zobrist = key
+    return undo
+
+
+def pop_move(board, move, undo):
+    bitboards = board.bitboards
+    ptype, captured, castle, en_passant, key = undo
+    enemy = board.turn
+    color = "black" if enemy == "white" else "white"
+    start, end, flag = move & 63, move >> 6 & 63, move >> 12
+
+    changed = 1 << start | 1 << end
+    if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+        rook_start, rook_end = CASTLING[(color, flag)][2:4]
+        bitboards.move("rook", color, rook_end, rook_start)
+        changed |= 1 << rook_start | 1 << rook_end
+    bitboards.remove(CODE_TYPES[bitboards.cells[end]], color, end)
+    bitboards.add(ptype, color, start)
+    if flag == EN_PASSANT:
+        bitboards.add("pawn", enemy, end - 8 if color == "white" else end + 8)
+        changed |= 1 << (end - 8 if color == "white" else end + 8)
+    elif captured is not None:
+        bitboards.add(captured, enemy, end)
+    board.attacks.update(bitboards, changed)
+
+    board.castle[0][:] = castle[0]
+    board.castle[1][:] = castle[1]
+    board.en_passant = en_passant
+    board.turn = color
+    board.zobrist = key
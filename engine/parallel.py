@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import time
+
+from engine.movegen import generate_legal_moves, move_to_uci
+from engine.rules import Board, read_fen, write_fen
+from engine.search import INFINITY, MATE_BOUND, MAX_PLY, SearchAborted, Searcher
+from engine.tablebase import Tablebases
+
+_searcher = None  # one per worker process, keeps its transposition table between tasks
+_iteration = None  # last iteration this worker searched for, its table ages once per iteration
+
+
+def _init_worker(hash_mb, tablebases):
+    global _searcher
+    # each process maps the tables itself, an mmap doesn't cross the pool
+    _searcher = Searcher(hash_mb, Tablebases(tablebases) if tablebases else None)
+
+
+def _search_move(task):
+    # positions travel as fen strings, deadlines as wall clock so they mean the same thing in every process
+    global _iteration
+    fen, move, depth, alpha, deadline, iteration = task
+    if iteration != _iteration:
+        _iteration = iteration
+        _searcher.tt.new_search()  # otherwise depth preferred replacement keeps stale deep entries forever
+    board = Board()
+    read_fen(fen, board)
+    _searcher.start_clock(None if deadline is None else max(deadline - time.time(), 1e-6))
+    try:
+        score = _searcher.search_move(board, move, depth, alpha)
+    except SearchAborted:
+        score = None
+    return move, score, _searcher.nodes
+
+
+class ParallelSearcher:
+    # root splitting: the first root move is searched alone to get a bound, the rest are spread over the pool
+    def __init__(self, workers=None, hash_mb=16, tablebases=None):
+        # tablebases is a directory of endgame tables, opened in every worker
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = multiprocessing.Pool(self.workers, _init_worker, (hash_mb, tablebases))
+        self.nodes = 0
+        self.iterations = 0  # tags tasks so workers can tell a new iteration from more of the same one
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search(self, board, depth=MAX_PLY, time_limit=None, info=None):
+        start = time.perf_counter()
+        deadline = time.time() + time_limit if time_limit else None
+        fen = write_fen(board)
+        moves = list(generate_legal_moves(board))
+        self.nodes = 0
+
+        result = {"move": moves[0] if moves else 0, "score": 0, "depth": 0, "nodes": 0, "time": 0.0, "nps": 0,
+                  "pv": []}
+        for iteration in range(1, min(depth, MAX_PLY) + 1):
+            if not moves:
+                break
+            scores = self._iterate(fen, moves, iteration, deadline)
+            if scores is None:
+                break
+            # stable sort so ties keep last iteration's order, the best move goes first next time
+            moves.sort(key=scores.get, reverse=True)
+            result["move"] = moves[0]
+            result["score"] = scores[moves[0]]
+            result["depth"] = iteration
+            result["pv"] = [move_to_uci(moves[0])]
+            self._timing(result, start)
+            if info is not None:
+                info(result)
+            if abs(result["score"]) > MATE_BOUND:
+                break
+        self._timing(result, start)
+        return result
+
+    def _iterate(self, fen, moves, depth, deadline):
+        self.iterations += 1
+        iteration = self.iterations
+        move, score, nodes = self.pool.apply(_search_move, ((fen, moves[0], depth, -INFINITY, deadline, iteration),))
+        self.nodes += nodes
+        if score is None:
+            return None
+        scores = {move: score}
+        # the rest only need to prove they are no better than the best so far, so they get its score as alpha
+        tasks = [(fen, move, depth, score, deadline, iteration) for move in moves[1:]]
+        aborted = False
+        for move, score, nodes in self.pool.imap_unordered(_search_move, tasks):
+            self.nodes += nodes
+            if score is None:
+                aborted = True
+            scores[move] = score
+        return None if aborted else scores
+
+    def _timing(self, result, start):
+        result["nodes"] = self.nodes
+        result["time"] = time.perf_counter() - start
+        result["nps"] = int(self.nodes / max(result["time"], 1e-9))
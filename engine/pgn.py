@@ -0,0 +1,108 @@
+import re
+
+from engine.bitboard import square
+from engine.movegen import (KING_CASTLE, QUEEN_CASTLE, generate_legal_moves, is_capture, move_end, move_flag,
+                            move_start, promotion_type, push_move)
+
+SAN_PATTERN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?")
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"(.*)"\]')
+SAN_PIECES = {"N": "knight", "B": "bishop", "R": "rook", "Q": "queen", "K": "king", None: "pawn"}
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+
+def read_games(lines):
+    # stream (tags, san moves) per game out of pgn text, holding only the current game in memory
+    tags = {}
+    tokens = []
+    in_moves = False
+    state = [0, False]  # variation depth and open {} comment, both can run across lines
+    for line in lines:
+        line = line.strip()
+        if state == [0, False] and line.startswith("["):
+            if in_moves:
+                yield tags, tokens
+                tags, tokens, in_moves = {}, [], False
+            match = TAG_PATTERN.match(line)
+            if match:
+                tags[match.group(1)] = match.group(2)
+            continue
+        if not line or line.startswith("%"):
+            continue
+        in_moves = True
+        _move_tokens(line, tokens, state)
+    if in_moves or tags:
+        yield tags, tokens
+
+
+def _move_tokens(line, tokens, state):
+    depth, comment = state
+    word = ""
+    for c in line + " ":
+        if comment:
+            comment = c != "}"
+            continue
+        if c.isspace() or c in "{;()":
+            if word and not depth:
+                _add_token(word, tokens)
+            word = ""
+        if c == "{":
+            comment = True
+        elif c == ";":
+            break
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(depth - 1, 0)
+        elif not c.isspace():
+            word += c
+    state[:] = depth, comment
+
+
+def _add_token(word, tokens):
+    # drop move numbers, nags and results, keep the san
+    word = word.split(".")[-1]
+    if word and not word.startswith("$") and word not in RESULTS:
+        tokens.append(word)
+
+
+def san_to_move(board, san):
+    text = san.rstrip("+#!?")
+    moves = generate_legal_moves(board)
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        flag = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+        for move in moves:
+            if move_flag(move) == flag:
+                return move
+        raise ValueError(f"illegal move {san}")
+
+    match = SAN_PATTERN.fullmatch(text)
+    if not match:
+        raise ValueError(f"bad move {san}")
+    piece, from_file, from_rank, target, promo = match.groups()
+    ptype = SAN_PIECES[piece]
+    end = square((ord(target[0]) - ord("a"), int(target[1]) - 1))
+    bitboards = board.bitboards
+    found = []
+    for move in moves:
+        start = move_start(move)
+        if move_end(move) != end or bitboards.type_at(start) != ptype:
+            continue
+        if from_file and start & 7 != ord(from_file) - ord("a"):
+            continue
+        if from_rank and start >> 3 != int(from_rank) - 1:
+            continue
+        if promotion_type(move) != (SAN_PIECES[promo] if promo else None):
+            continue
+        found.append(move)
+    if len(found) != 1:
+        raise ValueError(f"{'ambiguous' if found else 'illegal'} move {san}")
+    return found[0]
+
+
+def play(board, move):
+    # make_move without keeping an undo record, for replaying long games
+    capture_or_pawn = is_capture(move) or board.bitboards.type_at(move_start(move)) == "pawn"
+    push_move(board, move)
+    board.half_move = 0 if capture_or_pawn else board.half_move + 1
+    if board.turn == "white":
+        board.full_move += 1
@@ -0,0 +1,106 @@
+import struct
+import sys
+from array import array
+
+from engine.pgn import play
+from engine.rules import START_FEN, parse_fen, write_fen
+
+MAGIC = b"PCGR"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI")  # magic, version, flags, fen length, move count
+TIMED = 1  # flag: a uint32 per move follows the moves, ms since the game started
+SNAPSHOT_EVERY = 16
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class GameRecord:
+    # one game: starting fen, the engine's 16 bit move ints and, when times is given (even empty), when each
+    # move was made
+    def __init__(self, fen=START_FEN, moves=(), times=None):
+        self.fen = fen
+        self.moves = array("H", moves)
+        self.times = None if times is None else array("I", times)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add(self, move, ms=0):
+        self.moves.append(move)
+        if self.times is not None:
+            self.times.append(int(ms))
+
+    def to_bytes(self):
+        fen = b"" if self.fen == START_FEN else self.fen.encode()  # most games start from the usual position
+        flags = TIMED if self.times is not None else 0
+        data = HEADER.pack(MAGIC, VERSION, flags, len(fen), len(self.moves)) + fen
+        data += _little_endian(self.moves).tobytes()
+        if self.times is not None:
+            data += _little_endian(self.times).tobytes()
+        return data
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        # -> (record, offset just past it), data can be bytes or an mmap
+        magic, version, flags, fen_length, count = HEADER.unpack_from(data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"no game record at offset {offset}")
+        offset += HEADER.size
+        fen = bytes(data[offset:offset + fen_length]).decode() or START_FEN
+        offset += fen_length
+        record = cls(fen)
+        record.moves.frombytes(data[offset:offset + 2 * count])
+        record.moves = _little_endian(record.moves)
+        offset += 2 * count
+        if flags & TIMED:
+            record.times = array("I")
+            record.times.frombytes(data[offset:offset + 4 * count])
+            record.times = _little_endian(record.times)
+            offset += 4 * count
+        return record, offset
+
+
+def write_records(out, records):
+    # records are plain concatenated, so appending a game to an archive is one write
+    count = 0
+    for record in records:
+        out.write(record.to_bytes())
+        count += 1
+    return count
+
+
+def read_records(data):
+    offset = 0
+    while offset < len(data):
+        record, offset = GameRecord.from_bytes(data, offset)
+        yield record
+
+
+class Replayer:
+    # any ply of a game, a fen is kept every SNAPSHOT_EVERY plies so a lookup never pushes more moves than that
+    def __init__(self, record, every=SNAPSHOT_EVERY):
+        self.record = record
+        self.every = every
+        board = parse_fen(record.fen)
+        self.snapshots = [record.fen]
+        for ply, move in enumerate(record.moves, 1):
+            play(board, move)
+            if not ply % every:
+                self.snapshots.append(write_fen(board))
+
+    def __len__(self):
+        return len(self.record.moves) + 1
+
+    def position(self, ply):
+        # board after ply moves, 0 is the starting position
+        if not 0 <= ply <= len(self.record.moves):
+            raise IndexError(f"ply {ply} out of range")
+        board = parse_fen(self.snapshots[ply // self.every])
+        for move in self.record.moves[ply - ply % self.every:ply]:
+            play(board, move)
+        return board
@@ -0,0 +1,274 @@
+import struct
+
+from engine.attacks import AttackMaps
+from engine.bitboard import CODE_COLORS, CODE_TYPES, PIECE_TYPES, BitBoards, bit, square
+from engine.movegen import (CAPTURE, DOUBLE_PUSH, EN_PASSANT, KING_CASTLE, PROMOTION, PROMOTION_TYPES, QUEEN_CASTLE,
+                            QUIET, encode_move, generate_legal_moves, has_legal_move, in_check, is_capture, move_end,
+                            move_flag, move_start, pop_move, promotion_type, push_move)
+from engine.zobrist import compute_key
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+class Board:
+    # rules state only: bitboards plus one byte per square (bitboards.cells), pieces are read out with piece_at
+    def __init__(self):
+        self.turn = None
+        self.castle = [[False, False], [False, False]]
+        self.half_move = 0
+        self.full_move = 0
+        self.en_passant = [[], []]
+        self.check = [False, None]  # set by check_check
+        self.bitboards = BitBoards()
+        self.attacks = AttackMaps()
+        self.zobrist = 0
+        self.history = []  # undo records, one per move made
+
+    def piece_at(self, pos):
+        code = self.bitboards.cells[square(pos)]
+        if not code:
+            return None
+        piece = Piece(CODE_TYPES[code], CODE_COLORS[code])
+        piece.pos = tuple(pos)
+        return piece
+
+    def make_move(self, move):
+        capture_or_pawn = is_capture(move) or self.bitboards.type_at(move_start(move)) == "pawn"
+        self.history.append((move, push_move(self, move), self.half_move, self.full_move))
+        self.half_move = 0 if capture_or_pawn else self.half_move + 1
+        if self.turn == "white":
+            self.full_move += 1
+
+    def unmake_move(self):
+        move, undo, self.half_move, self.full_move = self.history.pop()
+        pop_move(self, move, undo)
+
+    def repetitions(self):
+        # earlier occurrences of this position, from the zobrist keys in the undo records. only positions since the
+        # last capture or pawn move can match, and only every other one has the same side to move
+        count = 0
+        history = self.history
+        for back in range(2, min(self.half_move, len(history)) + 1, 2):
+            if history[-back][1][4] == self.zobrist:
+                count += 1
+        return count
+
+
+class Piece:
+    # a look at one square of a board, made on demand; changing it doesn't change the board
+    __slots__ = ("type", "color", "pos")
+
+    def __init__(self, ptype, color):
+        self.type = ptype
+        self.color = color
+        self.pos = ()  # file, rank
+
+    def check_valid(self, pos, board, checking=False, king=None):
+        # the old click api, now read off generate_legal_moves: can this piece go to pos, and how. checking only asks
+        # whether the piece attacks pos (where king stands), whoever's turn it is
+        ret = {
+            "valid": False,
+            "passant": False,
+            "target": None,
+            "promo": False,
+            "castle": None
+        }
+        start, end = square(self.pos), square(pos)
+        if checking:
+            ret["target"] = king
+            ret["valid"] = board.bitboards.attackers(end, self.color) >> start & 1 == 1
+            return ret
+        ret["target"] = board.piece_at(pos)
+        if self.color != board.turn:
+            return ret
+        for move in generate_legal_moves(board):
+            if move_start(move) == start and move_end(move) == end:
+                flag = move_flag(move)
+                ret["valid"] = True
+                ret["passant"] = flag == EN_PASSANT
+                ret["promo"] = promotion_type(move) is not None
+                ret["castle"] = {KING_CASTLE: "left", QUEEN_CASTLE: "right"}.get(flag)
+                break
+        return ret
+
+
+def outcome(board):
+    # (result, reason) once the game is over, None while it goes on
+    if not has_legal_move(board):
+        if in_check(board):
+            return ("0-1" if board.turn == "white" else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if board.half_move >= 100:
+        return "1/2-1/2", "fifty move rule"
+    if board.repetitions() >= 2:
+        return "1/2-1/2", "threefold repetition"
+    return None
+
+
+def build_move(piece, pos, result, promo):
+    # check_valid's result -> the engine's move int, promo names the piece a promotion becomes
+    if result["castle"] is not None:
+        flag = KING_CASTLE if result["castle"] == "left" else QUEEN_CASTLE
+    elif result["passant"]:
+        flag = EN_PASSANT
+    elif result["promo"]:
+        flag = PROMOTION | PROMOTION_TYPES.index(promo) | (CAPTURE if result["target"] is not None else QUIET)
+    elif result["target"] is not None:
+        flag = CAPTURE
+    elif piece.type == "pawn" and abs(pos[1] - piece.pos[1]) == 2:
+        flag = DOUBLE_PUSH
+    else:
+        flag = QUIET
+    return encode_move(square(piece.pos), square(pos), flag)
+
+
+def check_check(board, piece, king_pos=None, checking=False, king=None):
+    result = piece.check_valid(king_pos, board, checking=True, king=king)
+    if result["valid"]:
+        board.check = [True, piece] if not checking else board.check
+        return True
+    return False
+
+
+def check_king(board, king, pos, target):
+    # whether king can stand on pos (capturing target, if any), asked of the attack maps
+    bitboards = board.bitboards
+    enemy = "black" if king.color == "white" else "white"
+    if not board.attacks.maps[enemy] & bitboards.pieces[king.color]["king"]:
+        # nothing sees the king, so lifting it can't open a line and the map is the whole answer
+        return not board.attacks.is_attacked(square(pos), enemy)
+    occupied = bitboards.all & ~bitboards.pieces[king.color]["king"]
+    attackers = bitboards.attackers(square(pos), enemy, occupied)
+    if target is not None:
+        attackers &= ~bit(target.pos)
+    return not attackers
+
+
+def read_fen(fen, board):  # default fen: rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1
+    parts = fen.split()
+    board_state = parts[0].split('/')
+    rank = 7
+    file = 0
+    for row in board_state:
+        for c in row:
+            if c.isnumeric():
+                file += int(c)
+                continue
+            board.bitboards.add(*FEN_PIECES[c], rank * 8 + file)
+            file += 1
+        rank -= 1
+        file = 0
+    match parts[1][0]:
+        case 'w':
+            board.turn = 'white'
+        case 'b':
+            board.turn = 'black'
+
+    board.castle[0][0] = ('K' in parts[2])
+    board.castle[0][1] = ('Q' in parts[2])
+    board.castle[1][0] = ('k' in parts[2])
+    board.castle[1][1] = ('q' in parts[2])
+
+    if parts[3][0] != '-':
+        target = [ord(parts[3][0]) - ord('a'), int(parts[3][1]) - 1]
+        board.en_passant = (target, None)
+
+    board.half_move = int(parts[4])
+    board.full_move = int(parts[5])
+    board.attacks.refresh(board.bitboards)
+    board.zobrist = compute_key(board)
+
+
+def write_fen(board):
+    bitboards = board.bitboards
+    rows = []
+    for rank in range(7, -1, -1):
+        row = ""
+        empty = 0
+        for file in range(8):
+            ptype = bitboards.type_at(rank * 8 + file)
+            if ptype is None:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            letter = "n" if ptype == "knight" else ptype[0]
+            row += letter.upper() if bitboards.color_at(rank * 8 + file) == "white" else letter
+        rows.append(row + (str(empty) if empty else ""))
+    castle = "".join(c for c, allowed in zip("KQkq", board.castle[0] + board.castle[1]) if allowed) or "-"
+    target = board.en_passant[0]
+    passant = f"{chr(ord('a') + target[0])}{target[1] + 1}" if target else "-"
+    return f"{'/'.join(rows)} {board.turn[0]} {castle} {passant} {board.half_move} {board.full_move}"
+
+
+FEN_PIECES = {letter: (ptype, color) for ptype, letter in zip(PIECE_TYPES, "pnbrqk")
+              for letter, color in ((letter.upper(), "white"), (letter, "black"))}
+
+
+def parse_fen(fen):
+    # read_fen that checks what it reads and raises ValueError, for fens from outside
+    parts = fen.split()
+    board = Board()
+    rows = parts[0].split("/") if parts else ()
+    if len(rows) != 8 or len(parts) < 4:
+        raise ValueError(f"bad fen: {fen!r}")
+    for index, row in enumerate(rows):
+        rank = 7 - index
+        file = 0
+        for c in row:
+            if c.isdigit():
+                file += int(c)
+            elif c in FEN_PIECES and file < 8:
+                board.bitboards.add(*FEN_PIECES[c], rank * 8 + file)
+                file += 1
+            else:
+                raise ValueError(f"bad fen: {fen!r}")
+        if file != 8:
+            raise ValueError(f"bad fen: {fen!r}")
+
+    if parts[1] not in ("w", "b") or not (parts[2] == "-" or set(parts[2]) <= set("KQkq")):
+        raise ValueError(f"bad fen: {fen!r}")
+    board.turn = "white" if parts[1] == "w" else "black"
+    board.castle = [["K" in parts[2], "Q" in parts[2]], ["k" in parts[2], "q" in parts[2]]]
+    if parts[3] != "-":
+        if len(parts[3]) != 2 or parts[3][0] not in "abcdefgh" or parts[3][1] not in "36":
+            raise ValueError(f"bad fen: {fen!r}")
+        board.en_passant = ([ord(parts[3][0]) - ord("a"), int(parts[3][1]) - 1], None)
+    else:
+        board.en_passant = ([], None)
+    # epd lines stop after the en passant field
+    board.half_move = int(parts[4]) if len(parts) > 4 and parts[4].isdigit() else 0
+    board.full_move = int(parts[5]) if len(parts) > 5 and parts[5].isdigit() else 1
+    board.attacks.refresh(board.bitboards)
+    board.zobrist = compute_key(board)
+    return board
+
+
+PACKED = struct.Struct("<64sBBHH")  # cells, turn and castling bits, en passant file + 1, half move, full move
+
+
+def pack_position(board):
+    # 70 bytes, for keeping lots of positions around without a Board each
+    rights = board.castle[0] + board.castle[1]
+    flags = (board.turn == "black") | sum(allowed << i for i, allowed in enumerate(rights, 1))
+    passant = board.en_passant[0][0] + 1 if board.en_passant[0] else 0
+    return PACKED.pack(bytes(board.bitboards.cells), flags, passant, board.half_move, board.full_move)
+
+
+def unpack_position(data, board=None):
+    cells, flags, passant, half_move, full_move = PACKED.unpack(data)
+    board = Board() if board is None else board
+    board.bitboards.clear()
+    for sq, code in enumerate(cells):
+        if code:
+            board.bitboards.add(CODE_TYPES[code], CODE_COLORS[code], sq)
+    board.turn = "black" if flags & 1 else "white"
+    board.castle = [[bool(flags & 2), bool(flags & 4)], [bool(flags & 8), bool(flags & 16)]]
+    board.en_passant = ([passant - 1, 5 if board.turn == "white" else 2], None) if passant else ([], None)
+    board.half_move = half_move
+    board.full_move = full_move
+    board.history = []
+    board.attacks.refresh(board.bitboards)
+    board.zobrist = compute_key(board)
+    return board
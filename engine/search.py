@@ -0,0 +1,256 @@
+import time
+
+from engine.bitboard import CODE_TYPES
+from engine.evaluate import evaluate
+from engine.movegen import CAPTURE, EN_PASSANT, PROMOTION, generate_legal_moves, has_legal_move, in_check, move_to_uci
+from engine.tablebase import MATE as TABLEBASE_MATE
+from engine.transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+MATE = 100000
+MATE_BOUND = MATE - 1000  # scores past this are mates, counted in plies from the root
+INFINITY = 1000000
+MAX_PLY = 64
+CHECK_EVERY = 256  # nodes between clock reads
+
+# most valuable victim, least valuable attacker
+MVV_LVA = {"pawn": 1, "knight": 3, "bishop": 3, "rook": 5, "queen": 9, "king": 10}
+
+
+class SearchAborted(Exception):
+    pass
+
+
+def _score_to_tt(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def _score_from_tablebase(score, ply):
+    # tablebase scores count plies from the probed position, search mates count from the root
+    if not score:
+        return 0
+    plies = TABLEBASE_MATE - abs(score)
+    return MATE - ply - plies if score > 0 else -(MATE - ply - plies)
+
+
+def format_score(score):
+    # uci style: "cp 35", or "mate 3" / "mate -2" in moves
+    if score > MATE_BOUND:
+        return f"mate {(MATE - score + 1) // 2}"
+    if score < -MATE_BOUND:
+        return f"mate -{(MATE + score) // 2}"
+    return f"cp {score}"
+
+
+class Searcher:
+    def __init__(self, hash_mb=16, tablebases=None):
+        self.tt = TranspositionTable(hash_mb)
+        self.tablebases = tablebases  # engine.tablebase.Tablebases, probed below the root
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [0] * 8192  # colour * 4096 + start/end squares
+        self.nodes = 0
+        self.deadline = None
+        self.node_limit = None
+        self.stopped = False
+        self.root_move = 0
+
+    def stop(self):
+        # safe to call from another thread, the search notices within a node
+        self.stopped = True
+
+    def start_clock(self, time_limit=None, node_limit=None):
+        start = time.perf_counter()
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = start + time_limit if time_limit else None
+        self.node_limit = node_limit
+        return start
+
+    def search(self, board, depth=MAX_PLY, time_limit=None, node_limit=None, info=None):
+        start = self.start_clock(time_limit, node_limit)
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [0] * 8192
+        self.tt.new_search()
+        root_length = len(board.history)
+
+        result = {"move": 0, "score": 0, "depth": 0, "nodes": 0, "time": 0.0, "nps": 0, "pv": []}
+        for iteration in range(1, min(depth, MAX_PLY) + 1):
+            self.root_move = 0
+            try:
+                score = self._negamax(board, iteration, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                while len(board.history) > root_length:
+                    board.unmake_move()
+                break
+            result["move"] = self.root_move
+            result["score"] = score
+            result["depth"] = iteration
+            result["pv"] = self.principal_variation(board, iteration)
+            self._timing(result, start)
+            if info is not None:
+                info(result)
+            if not self.root_move or abs(score) > MATE_BOUND:
+                break
+
+        if not result["move"]:
+            # stopped before depth 1 finished, any legal move beats none
+            moves = self._order(board, list(generate_legal_moves(board)), 0, 0)
+            result["move"] = moves[0] if moves else 0
+        self._timing(result, start)
+        return result
+
+    def _timing(self, result, start):
+        result["nodes"] = self.nodes
+        result["time"] = time.perf_counter() - start
+        result["nps"] = int(self.nodes / max(result["time"], 1e-9))
+
+    def search_move(self, board, move, depth, alpha=-INFINITY, beta=INFINITY):
+        # score of one root move from the root side's view, the unit of work for root splitting
+        root_length = len(board.history)
+        board.make_move(move)
+        try:
+            return -self._negamax(board, depth - 1, -beta, -alpha, 1)
+        finally:
+            while len(board.history) > root_length:
+                board.unmake_move()
+
+    def _tick(self):
+        self.nodes += 1
+        if self.stopped or (self.node_limit is not None and self.nodes >= self.node_limit):
+            raise SearchAborted
+        if self.deadline is not None and not self.nodes % CHECK_EVERY and time.perf_counter() >= self.deadline:
+            raise SearchAborted
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self._tick()
+        # draws first, a table entry stored from another move order doesn't know this one repeats
+        if ply and board.repetitions():
+            return 0  # a position seen before can be repeated into a draw, so it scores as one
+        if ply and board.half_move >= 100 and (not in_check(board) or has_legal_move(board)):
+            return 0  # mate on the hundredth ply still counts
+
+        key = board.zobrist
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if ply and tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if tt_flag == EXACT or (tt_flag == LOWER and tt_score >= beta) or \
+                        (tt_flag == UPPER and tt_score <= alpha):
+                    return tt_score
+
+        if ply and self.tablebases is not None:
+            score = self.tablebases.probe(board)
+            if score is not None:
+                return _score_from_tablebase(score, ply)
+
+        checked = in_check(board)
+        if checked and ply < MAX_PLY // 2:
+            depth += 1  # check extension
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiesce(board, alpha, beta, ply)
+
+        moves = list(generate_legal_moves(board))
+        if not moves:
+            return -MATE + ply if checked else 0
+
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = 0
+        side = 0 if board.turn == "white" else 4096
+        for move in self._order(board, moves, tt_move, ply):
+            board.make_move(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best:
+                best = score
+                best_move = move
+                if not ply:
+                    self.root_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not move >> 12 & (CAPTURE | PROMOTION):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.history[side + (move & 4095)] = min(self.history[side + (move & 4095)] + depth * depth,
+                                                             500000)
+                break
+
+        flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.tt.store(key, depth, _score_to_tt(best, ply), flag, best_move)
+        return best
+
+    def _quiesce(self, board, alpha, beta, ply):
+        self._tick()
+        checked = in_check(board)
+        if not checked or ply >= MAX_PLY:
+            stand_pat = evaluate(board)
+            if stand_pat >= beta or ply >= MAX_PLY:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+
+        # in check every evasion is searched so mates at the horizon are seen
+        moves = list(generate_legal_moves(board, captures_only=not checked))
+        if not moves:
+            return -MATE + ply if checked else alpha
+        for move in self._order(board, moves, 0, ply):
+            board.make_move(move)
+            score = -self._quiesce(board, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order(self, board, moves, tt_move, ply):
+        cells = board.bitboards.cells
+        killers = self.killers[min(ply, MAX_PLY)]
+        history = self.history
+        side = 0 if board.turn == "white" else 4096
+
+        def priority(move):
+            if move == tt_move:
+                return 10000000
+            flag = move >> 12
+            if flag & CAPTURE:
+                victim = "pawn" if flag == EN_PASSANT else CODE_TYPES[cells[move >> 6 & 63]]
+                return 1000000 + MVV_LVA[victim] * 100 - MVV_LVA[CODE_TYPES[cells[move & 63]]] + (flag & PROMOTION) * 10
+            if flag & PROMOTION:
+                return 900000 + (flag & 3)
+            if move == killers[0]:
+                return 800000
+            if move == killers[1]:
+                return 799999
+            return history[side + (move & 4095)]
+
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def principal_variation(self, board, depth):
+        line = []
+        for _ in range(depth):
+            entry = self.tt.probe(board.zobrist)
+            if entry is None or entry[3] not in generate_legal_moves(board):
+                break
+            line.append(entry[3])
+            board.make_move(entry[3])
+        for _ in line:
+            board.unmake_move()
+        return [move_to_uci(move) for move in line]
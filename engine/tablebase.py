@@ -0,0 +1,169 @@
+import mmap
+import os
+from array import array
+
+from engine.movegen import generate_legal_moves, in_check, is_capture, move_end, move_start, promotion_type
+from engine.rules import Board
+
+# one table per material, the extra piece always belongs to white; black-strong positions are probed mirrored
+TABLES = {"KQK": "queen", "KRK": "rook", "KPK": "pawn"}
+BUILD_ORDER = ("KQK", "KRK", "KPK")  # pawn tables lean on the ones they promote into
+MAGIC = b"PCTB"
+HEADER = 16
+SIZE = 2 * 64 * 64 * 64
+
+# byte per position: 0 draw, 255 illegal, otherwise plies to mate + 1 (odd plies: side to move mates, even: gets mated)
+DRAW = 0
+ILLEGAL = 255
+MATE = 1000  # solver scores: MATE - plies for a win, -(MATE - plies) for a loss
+
+
+def table_index(black_to_move, white_king, black_king, piece):
+    return black_to_move << 18 | white_king << 12 | black_king << 6 | piece
+
+
+def _decode(value):
+    # -> solver score from the side to move's view, None for illegal
+    if value == ILLEGAL:
+        return None
+    if value == DRAW:
+        return 0
+    plies = value - 1
+    return MATE - plies if plies % 2 else -(MATE - plies)
+
+
+def generate(name, solved=None):
+    # retrograde solve of one table as value iteration over every position's legal successors.
+    # solved maps names to already built tables (byte arrays) for promotions to land in
+    import numpy as np  # only building needs numpy, probing is plain mmap reads
+
+    ptype = TABLES[name]
+    board = Board()
+    board.castle = [[False, False], [False, False]]
+    board.en_passant = ([], None)
+    bitboards = board.bitboards
+
+    legal = np.zeros(SIZE, dtype=bool)
+    fixed = np.zeros(SIZE, dtype=np.int32)  # scores of positions with no moves
+    has_moves = np.zeros(SIZE, dtype=bool)
+    offsets = array("q")
+    children = array("q")
+    constants = [0]  # extra solver nodes past SIZE: index SIZE is a draw, then one per promotion outcome
+    constant_index = {0: SIZE}
+
+    def constant(score):
+        if score not in constant_index:
+            constant_index[score] = SIZE + len(constants)
+            constants.append(score)
+        return constant_index[score]
+
+    for index in range(SIZE):
+        black_to_move, white_king, black_king, piece = index >> 18, index >> 12 & 63, index >> 6 & 63, index & 63
+        if len({white_king, black_king, piece}) < 3 or (ptype == "pawn" and not 8 <= piece < 56):
+            continue
+        bitboards.clear()
+        bitboards.add("king", "white", white_king)
+        bitboards.add("king", "black", black_king)
+        bitboards.add(ptype, "white", piece)
+        board.turn = "black" if black_to_move else "white"
+        board.attacks.refresh(bitboards)
+        if in_check(board, "white" if black_to_move else "black"):
+            continue
+        legal[index] = True
+
+        moves = list(generate_legal_moves(board))
+        if not moves:
+            fixed[index] = -MATE if in_check(board) else 0
+            continue
+        has_moves[index] = True
+        offsets.append(len(children))
+        for move in moves:
+            start, end = move_start(move), move_end(move)
+            if is_capture(move):
+                children.append(SIZE)  # the extra piece is gone, bare kings
+            elif promotion_type(move):
+                promoted = {"queen": "KQK", "rook": "KRK"}.get(promotion_type(move))
+                if promoted is None or solved is None or promoted not in solved:
+                    children.append(SIZE)  # minor piece promotions can't mate
+                else:
+                    score = _decode(int(solved[promoted][table_index(1, white_king, black_king, end)]))
+                    children.append(constant(score or 0))
+            elif start == white_king:
+                children.append(table_index(1, end, black_king, piece))
+            elif start == black_king:
+                children.append(table_index(0, white_king, end, piece))
+            else:
+                children.append(table_index(1, white_king, black_king, end))
+
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    children = np.frombuffer(children, dtype=np.int64)
+    values = np.zeros(SIZE + len(constants), dtype=np.int32)
+    values[:SIZE] = fixed
+    values[SIZE:] = constants
+    movers = np.flatnonzero(has_moves)
+    while True:
+        best = np.maximum.reduceat(-values[children], offsets)
+        best -= np.sign(best)  # one ply further from the mate
+        if np.array_equal(best, values[movers]):
+            break
+        values[movers] = best
+
+    table = np.full(SIZE, ILLEGAL, dtype=np.uint8)
+    scores = values[:SIZE][legal]
+    table[legal] = np.where(scores == 0, DRAW, MATE - np.abs(scores) + 1)
+    return table
+
+
+def write_table(table, name, path):
+    with open(path, "wb") as out:
+        out.write(MAGIC + name.encode().ljust(HEADER - len(MAGIC), b"\0"))
+        out.write(table.tobytes())
+
+
+class Tablebases:
+    # mmapped tables from a directory of <name>.pctb files, a probe is one byte read
+    def __init__(self, directory):
+        self.files = {}
+        self.tables = {}
+        for name, ptype in TABLES.items():
+            path = os.path.join(directory, f"{name}.pctb")
+            if not os.path.exists(path):
+                continue
+            handle = open(path, "rb")
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            if data[:len(MAGIC)] != MAGIC or len(data) != HEADER + SIZE:
+                raise ValueError(f"{path} is not a tablebase file")
+            self.files[name] = (handle, data)
+            self.tables[ptype] = data
+
+    def close(self):
+        for handle, data in self.files.values():
+            data.close()
+            handle.close()
+        self.files.clear()
+        self.tables.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def probe(self, board):
+        # MATE - plies when the side to move mates, -(MATE - plies) when it gets mated, 0 for a draw,
+        # None when no table covers the position
+        bitboards = board.bitboards
+        if bitboards.all.bit_count() != 3 or any(board.castle[0] + board.castle[1]):
+            return None
+        for strong, weak in (("white", "black"), ("black", "white")):
+            for ptype, data in self.tables.items():
+                piece = bitboards.pieces[strong][ptype]
+                if not piece:
+                    continue
+                squares = [bitboards.pieces[strong]["king"], bitboards.pieces[weak]["king"], piece]
+                squares = [bb.bit_length() - 1 for bb in squares]
+                if strong == "black":
+                    squares = [sq ^ 56 for sq in squares]  # flip the board so the strong side is white
+                black_to_move = board.turn != strong
+                return _decode(data[HEADER + table_index(black_to_move, *squares)])
+        return None
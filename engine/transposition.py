@@ -0,0 +1,60 @@
+from array import array
+
+EMPTY = 0
+EXACT = 1
+LOWER = 2  # score is at least this (fail high)
+UPPER = 3  # score is at most this (fail low)
+
+ENTRY_BYTES = 16  # one 64 bit key plus one 64 bit packed entry
+SCORE_OFFSET = 1 << 31
+
+
+def _pack(depth, score, flag, move, age):
+    return move | depth << 16 | flag << 24 | age << 26 | (score + SCORE_OFFSET) << 32
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)  # round down to a power of two so the index is a mask
+        self.mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.data = array("Q", bytes(8 * self.size))
+        self.age = 0
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * self.size))
+        self.data = array("Q", bytes(8 * self.size))
+        self.age = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 63
+
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] != key:
+            return None
+        entry = self.data[index]
+        if not entry:
+            return None
+        return entry >> 16 & 255, (entry >> 32) - SCORE_OFFSET, entry >> 24 & 3, entry & 0xFFFF
+
+    def store(self, key, depth, score, flag, move=0):
+        index = key & self.mask
+        depth = min(max(depth, 0), 255)
+        old = self.data[index]
+        if old:
+            if self.keys[index] == key:
+                if not move:
+                    move = old & 0xFFFF  # keep the best move from a shallower pass
+            elif old >> 26 & 63 == self.age and old >> 16 & 255 > depth:
+                # depth preferred within a search, anything left over from older searches gets replaced
+                return
+        self.keys[index] = key
+        self.data[index] = _pack(depth, score, flag, move, self.age)
+
+    def hashfull(self):
+        # per mille of the first thousand slots written this search, the usual uci figure
+        sample = min(1000, self.size)
+        used = sum(1 for i in range(sample) if self.data[i] and self.data[i] >> 26 & 63 == self.age)
+        return used * 1000 // sample
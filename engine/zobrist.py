@@ -0,0 +1,41 @@
+import random
+
+from engine.bitboard import COLORS, PAWN_ATTACKS, PIECE_TYPES, square
+
+_random = random.Random(0x5EED)  # fixed seed, keys have to match between runs and processes
+
+PIECE_KEYS = {color: {ptype: [_random.getrandbits(64) for _ in range(64)] for ptype in PIECE_TYPES}
+              for color in COLORS}
+TURN_KEY = _random.getrandbits(64)  # xored in when black is to move
+CASTLE_KEYS = [[_random.getrandbits(64), _random.getrandbits(64)], [_random.getrandbits(64), _random.getrandbits(64)]]
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+
+
+def en_passant_key(bitboards, color, target):
+    # the file key only goes in when a pawn of color (the side to move) can take on target, like polyglot does,
+    # otherwise a double push nobody can answer would make the same position hash two ways
+    sq = square(target)
+    if PAWN_ATTACKS["black" if color == "white" else "white"][sq] & bitboards.pieces[color]["pawn"]:
+        return EN_PASSANT_KEYS[sq & 7]
+    return 0
+
+
+def compute_key(board):
+    key = 0
+    for color in COLORS:
+        for ptype in PIECE_TYPES:
+            keys = PIECE_KEYS[color][ptype]
+            bb = board.bitboards.pieces[color][ptype]
+            while bb:
+                low = bb & -bb
+                key ^= keys[low.bit_length() - 1]
+                bb ^= low
+    if board.turn == "black":
+        key ^= TURN_KEY
+    for side in range(2):
+        for index in range(2):
+            if board.castle[side][index]:
+                key ^= CASTLE_KEYS[side][index]
+    if board.en_passant[0]:
+        key ^= en_passant_key(board.bitboards, board.turn, board.en_passant[0])
+    return key
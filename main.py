@@ -1,43 +1,82 @@
+import argparse
+import csv
+import json
 import sys
+import threading
+import time
+from collections import deque
+from fractions import Fraction
 
 import pygame.display
 from pygame.locals import *
+from data.archive import open_assets
 from data.assets import *
-
-
-class Board:
-    def __init__(self, image, x, y):
-        self.image = image
-        self.x = x
-        self.y = y
-        self.turn = None
-        self.castle = [[False, False], [False, False]]
-        self.half_move = 0
-        self.full_move = 0
-        self.en_passant = [[], []]
-        self.piece_list = []
-        self.kings = {}
-        self.check = [False, None]
-        self.grid = [[None for _ in range(8)] for i in range(8)]
-        self.grid_cache = None
-        self.cache = self.grid, self.piece_list, self.castle
-        self.promo = "queen"
-
-
-class Piece:
-    def __init__(self, ptype, color, x, y):
-        self.type = ptype
-        self.color = color
+from engine.bitboard import CODE_COLORS, COLORS, PIECE_TYPES, iter_bits, square, square_pos
+from engine.book import OpeningBook
+from engine.movegen import generate_legal_moves, move_end, move_start, promotion_type
+from engine.record import GameRecord
+from engine.rules import START_FEN, Board, outcome, read_fen, write_fen
+from engine.search import Searcher
+
+
+class SpriteAtlas:
+    # every piece sprite read once into one sheet (plus a 24px copy for dragging), pieces get shared subsurfaces
+    def __init__(self):
+        self.sheet = None
+        self.scaled_sheet = None
+        self.images = {}
+        self.scaled = {}
+
+    def load(self, assets=None):
+        if self.sheet is not None:
+            return
+        if assets is None:
+            assets = open_assets(ASSET_PATH)
+        keys = [(ptype, color) for color in COLORS for ptype in PIECE_TYPES]
+        self.sheet = pygame.Surface((16 * len(keys), 16)).convert()
+        self.sheet.fill(PIECE_COLORKEY)
+        for i, (ptype, color) in enumerate(keys):
+            self.sheet.blit(assets.image(f"{ptype}_{color}.png"), (i * 16, 0))
+        self.scaled_sheet = pygame.transform.scale(self.sheet, (24 * len(keys), 24))
+        for i, key in enumerate(keys):
+            self.images[key] = self.sheet.subsurface((i * 16, 0, 16, 16))
+            self.scaled[key] = self.scaled_sheet.subsurface((i * 24, 0, 24, 24))
+            self.images[key].set_colorkey(PIECE_COLORKEY)
+            self.scaled[key].set_colorkey(PIECE_COLORKEY)
+
+    def get(self, ptype, color):
+        self.load()
+        return self.images[(ptype, color)], self.scaled[(ptype, color)]
+
+
+class PieceSprite:
+    # what the ui draws for one occupied square, type and colour are read off the board's cells so the rules
+    # state lives only in the board; board_sprites makes a fresh set after every move
+    __slots__ = ("board", "sq", "image", "scaled", "x", "y", "hold", "rect", "drag", "offset")
+
+    def __init__(self, board, sq):
+        self.board = board
+        self.sq = sq
         self.image = None
-        self.x = x
-        self.y = y
+        self.x = 0
+        self.y = 0
         self.hold = ()
-        self.pos = ()  # x, y
         self.rect = None
         self.drag = False
         self.scaled = None
         self.offset = [0, 0]
-        self.moved = False
+
+    @property
+    def type(self):
+        return self.board.bitboards.type_at(self.sq)
+
+    @property
+    def color(self):
+        return CODE_COLORS[self.board.bitboards.cells[self.sq]]
+
+    @property
+    def pos(self):
+        return square_pos(self.sq)
 
     def display(self, surface, scaled=False):
         if self.image is not None:
@@ -51,9 +90,7 @@ class Piece:
                 blit_center(surface, self.image, [int(self.rect.x) + center_x, int(self.rect.y) + center_y])
 
     def load_image(self):
-        self.image = pygame.image.load(f"data/chess_sprites/{self.type}_{self.color}.png").convert()
-        self.image.set_colorkey(PIECE_COLORKEY)
-        self.scaled = pygame.transform.scale(self.image, (24, 24))
+        self.image, self.scaled = SPRITES.get(self.type, self.color)
         self.rect = pygame.Rect(self.x, self.y, 16, 16)
 
     def update(self):
@@ -63,362 +100,400 @@ class Piece:
     def set_hold(self):
         self.hold = (self.rect.x, self.rect.y)
 
-    def get_board_pos(self, board_loc, init=False):
-        if init:
-            self.pos = int((self.x - board_loc[0]) // SQUARE_SIZE), int(abs((self.y - board_loc[1]) // SQUARE_SIZE - 7))
-            return self.pos
-        return int((self.x - board_loc[0]) // SQUARE_SIZE), int(abs((self.y - board_loc[1]) // SQUARE_SIZE - 7))
-
-    def check_valid(self, pos, board, checking=False, king=None):  # why did i implement it like this
-        ret = {
-            "valid": False,
-            "passant": False,
-            "target": None,
-            "promo": False,
-            "castle": None
-        }
-        if self.color != board.turn and not checking:
-            return ret
-
-        sign = 1 - 2 * (self.color == "black")
-        movement_array = (int(pos[0] - self.pos[0]), int(pos[1] - self.pos[1]))  # fd, rd
-
-        if movement_array in move_set[self.type]:
-            ret["target"] = board.grid[pos[1]][pos[0]] if not checking else king
-            if ret["target"] is not None and ret["target"].color == self.color:
-                return ret
-            null = ret["target"] is None
-            match self.type:
-                case "pawn":
-                    ret["passant"] = null and list(pos) == board.en_passant[0] and (
-                            movement_array[0] == 1 or movement_array[0] == -1)
-                    if (not null and movement_array[0] != 0 and movement_array[1] * sign > 0) or ret["passant"]:
-                        ret["valid"] = True
-                        if not checking:
-                            if pos[1] == 7 or pos[1] == 0:
-                                ret["promo"] = True
-
-                    elif not null or movement_array[0] != 0:
-                        return ret
-
-                    if not self.moved and movement_array[1] == 2 * sign:
-                        if board.grid[pos[1] - 1 + 2 * (movement_array[1] < 0)][pos[0]] is None:
-                            board.en_passant = ([self.pos[0], self.pos[1] + sign], self)
-                            ret["valid"] = True
-
-                    if movement_array[1] == 1 * sign:
-                        ret["valid"] = True
-                        if pos[1] == 7 or pos[1] == 0:
-                            ret["promo"] = True  # now implement promotion... bruh i think i need to implement UI
-
-                case "knight":
-                    if (movement_array[0] == 2 or movement_array[0] == -2) and (
-                            movement_array[1] == 1 or movement_array[1] == -1):
-                        ret["valid"] = True
-                    elif (movement_array[0] == 1 or movement_array[0] == -1) and (
-                            movement_array[1] == 2 or movement_array[1] == -2):
-                        ret["valid"] = True
-
-                case "bishop":
-                    ret["valid"] = True
-                    rank_dir = 1 - 2 * (movement_array[1] < 0)
-                    file_dir = 1 - 2 * (movement_array[0] < 0)
-                    for i in range(self.pos[1] + rank_dir, pos[1] + rank_dir, rank_dir):
-                        destination = board.grid[i][
-                            self.pos[0] + i * rank_dir * file_dir - self.pos[1] * rank_dir * file_dir]
-                        if destination is not None:
-                            if ret["target"] is not None:
-                                if destination.pos != ret["target"].pos:
-                                    ret["valid"] = False
-                            else:
-                                ret["valid"] = False
-
-                case "rook":
-                    ret["valid"] = True
-                    rank_dir = 1 - 2 * (movement_array[1] < 0) if movement_array[1] != 0 else 0
-                    file_dir = 1 - 2 * (movement_array[0] < 0) if movement_array[0] != 0 else 0
-                    if movement_array[1] == 0:
-                        for i in range(self.pos[0] + file_dir, pos[0] + file_dir, file_dir):
-                            destination = board.grid[self.pos[1]][i]
-                            if destination is not None:
-                                if ret["target"] is not None:
-                                    if destination.pos != ret["target"].pos:
-                                        ret["valid"] = False
-                                else:
-                                    ret["valid"] = False
-                    elif movement_array[0] == 0:
-                        for i in range(self.pos[1] + rank_dir, pos[1] + rank_dir, rank_dir):
-                            destination = board.grid[i][self.pos[0]]
-                            if destination is not None:
-                                if ret["target"] is not None:
-                                    if destination.pos != ret["target"].pos:
-                                        ret["valid"] = False
-                                else:
-                                    ret["valid"] = False
-                    if ret["valid"] and not self.moved and not checking:
-                        board.castle[self.color == "black"][self.pos[0] == 0] = False
-
-                case "queen":
-                    ret["valid"] = True
-                    if movement_array in move_set["bishop"]:
-                        rank_dir = 1 - 2 * (movement_array[1] < 0)
-                        file_dir = 1 - 2 * (movement_array[0] < 0)
-                        for i in range(self.pos[1] + rank_dir, pos[1] + rank_dir, rank_dir):
-                            destination = board.grid[i][
-                                self.pos[0] + i * rank_dir * file_dir - self.pos[1] * rank_dir * file_dir]
-                            if destination is not None:
-                                if ret["target"] is not None:
-                                    if destination.pos != ret["target"].pos:
-                                        ret["valid"] = False
-                                else:
-                                    ret["valid"] = False
-                    elif movement_array in move_set["rook"]:
-                        rank_dir = 1 - 2 * (movement_array[1] < 0) if movement_array[1] != 0 else 0
-                        file_dir = 1 - 2 * (movement_array[0] < 0) if movement_array[0] != 0 else 0
-                        if movement_array[1] == 0:
-                            for i in range(self.pos[0] + file_dir, pos[0] + file_dir, file_dir):
-                                destination = board.grid[self.pos[1]][i]
-                                if destination is not None:
-                                    if ret["target"] is not None:
-                                        if destination.pos != ret["target"].pos:
-                                            ret["valid"] = False
-                                    else:
-                                        ret["valid"] = False
-                        elif movement_array[0] == 0:
-                            for i in range(self.pos[1] + rank_dir, pos[1] + rank_dir, rank_dir):
-                                destination = board.grid[i][self.pos[0]]
-                                if destination is not None:
-                                    if ret["target"] is not None:
-                                        if destination.pos != ret["target"].pos:
-                                            ret["valid"] = False
-                                    else:
-                                        ret["valid"] = False
-
-                case "king":
-                    if movement_array[0] == 2 and board.castle[self.color == "black"][0]:
-                        if check_king(board, self, pos, ret["target"]) and check_king(board, self, [pos[0] - 1, pos[1]],
-                                                                                      ret["target"]):
-                            ret["valid"] = True
-                            if not checking:
-                                ret["castle"] = "left"
-                                board.castle[self.color == "black"] = [False, False]
-                    elif movement_array[0] == -2 and board.castle[self.color == "black"][1]:
-                        if check_king(board, self, pos, ret["target"]) and check_king(board, self, [pos[0] + 1, pos[1]],
-                                                                                      ret["target"]) and \
-                                board.grid[pos[1]][pos[0] - 1] is None:
-                            ret["valid"] = True
-                            if not checking:
-                                ret["castle"] = "right"
-                                board.castle[self.color == "black"] = [False, False]
-                    elif movement_array[0] != 2 and movement_array[0] != -2:
-                        if check_king(board, self, pos, ret["target"]):
-                            board.castle[self.color == "black"] = [False, False]
-                            ret["valid"] = True
-
-            return ret
-        else:
-            return ret
-
-
-def check_check(board, piece, king_pos=None, checking=False, king=None):
-    result = piece.check_valid(king_pos, board, checking=True, king=king)
-    if result["valid"]:
-        board.check = [True, piece] if not checking else board.check
-        return True
-    return False
-
-
-def check_king(board, king, pos, target):
-    cache = king.pos
-    for piece in board.piece_list:
-        if piece.color != king.color and piece != target:
-            movement_arr = pos[0] - piece.pos[0], pos[1] - piece.pos[1]
-            if movement_arr in move_set[piece.type]:
-                if piece.type == "king":
-                    return False
-                king.pos = pos
-                if check_check(board, piece, king_pos=pos, checking=True, king=king):
-                    king.pos = cache
-                    return False
-    king.pos = cache
-    return True
-
-
-def read_fen(fen, board):  # default fen: rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1
-    parts = fen.split()
-    board_state = parts[0].split('/')
-    rank = 7
-    file = 0
-    for row in board_state:
-        for c in row:
-            if c.isnumeric():
-                file += int(c)
-                continue
-            x = board.x + file * SQUARE_SIZE
-            y = board.y + (7 - rank) * SQUARE_SIZE
-            match c:
-                case 'p':
-                    init_piece = Piece('pawn', 'black', x, y)
-                    init_piece.load_image()
-                case 'n':
-                    init_piece = Piece('knight', 'black', x, y)
-                    init_piece.load_image()
-                case 'b':
-                    init_piece = Piece('bishop', 'black', x, y)
-                    init_piece.load_image()
-                case 'r':
-                    init_piece = Piece('rook', 'black', x, y)
-                    init_piece.load_image()
-                case 'q':
-                    init_piece = Piece('queen', 'black', x, y)
-                    init_piece.load_image()
-                case 'k':
-                    init_piece = Piece('king', 'black', x, y)
-                    init_piece.load_image()
-                    board.kings['black'] = init_piece
-                case 'P':
-                    init_piece = Piece('pawn', 'white', x, y)
-                    init_piece.load_image()
-                case 'N':
-                    init_piece = Piece('knight', 'white', x, y)
-                    init_piece.load_image()
-                case 'B':
-                    init_piece = Piece('bishop', 'white', x, y)
-                    init_piece.load_image()
-                case 'R':
-                    init_piece = Piece('rook', 'white', x, y)
-                    init_piece.load_image()
-                case 'Q':
-                    init_piece = Piece('queen', 'white', x, y)
-                    init_piece.load_image()
-                case 'K':
-                    init_piece = Piece('king', 'white', x, y)
-                    init_piece.load_image()
-                    board.kings['white'] = init_piece
-                case _:
-                    init_piece = None
-            init_piece.get_board_pos(board_loc, init=True)
-            board.grid[rank][file] = init_piece
-            board.piece_list.append(init_piece) if init_piece is not None else ...
-            file += 1
-        rank -= 1
-        file = 0
-    match parts[1][0]:
-        case 'w':
-            board.turn = 'white'
-        case 'b':
-            board.turn = 'black'
-
-    board.castle[0][0] = ('K' in parts[2])
-    board.castle[0][1] = ('Q' in parts[2])
-    board.castle[1][0] = ('k' in parts[2])
-    board.castle[1][1] = ('q' in parts[2])
-
-    if parts[3][0] != '-':
-        board.en_passant = [ord(parts[3][0]) - ord('a'), int(parts[3][1]) - 1]
-
-    board.half_move = int(parts[4][0])
-    board.full_move = int(parts[5][0])
+    def place(self, board_loc):
+        self.x = board_loc[0] + self.pos[0] * SQUARE_SIZE
+        self.y = board_loc[1] + (7 - self.pos[1]) * SQUARE_SIZE
+        self.update()
+
+
+def board_sprites(board, board_loc):
+    # square -> placed sprite for every piece on the board
+    sprites = {}
+    for sq in iter_bits(board.bitboards.all):
+        sprite = PieceSprite(board, sq)
+        sprite.load_image()
+        sprite.place(board_loc)
+        sprites[sq] = sprite
+    return sprites
 
 
 # 3d3d3d
 SQUARE_SIZE = 16
 PIECE_COLORKEY = (255, 232, 232)
-
-pygame.init()
-pygame.mixer.pre_init(44100, -16, 2, 512)  # freq, size, mono/stereo, buffer
-pygame.mixer.set_num_channels(64)
+ASSET_PATH = "data/chess_sprites"
 
 frame_rate = 60
-WINDOW_SIZE = (pygame.display.Info().current_w // 16 * 13, pygame.display.Info().current_h // 9 * 7)
+idle_timeout = 500  # ms an idle loop sleeps in event.wait before looking round anyway
+ENGINE_DONE = pygame.event.custom_type()
 DISPLAY_SIZE = (320, 180)
-MONITOR_SIZE = (pygame.display.Info().current_w, pygame.display.Info().current_h)
-
-
-move_set = {
-    "pawn": ((0, 1), (1, 1), (-1, 1), (0, 2), (0, -1), (1, -1), (-1, -1), (0, -2)),
-    "knight": ((2, 1), (2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2), (-2, 1), (-2, -1)),
-    "bishop": (
-        (1, 1), (2, 2), (3, 3), (4, 4), (5, 5), (6, 6), (7, 7), (1, -1), (2, -2), (3, -3), (4, -4), (5, -5), (6, -6),
-        (7, -7), (-1, 1), (-2, 2), (-3, 3), (-4, 4), (-5, 5), (-6, 6), (-7, 7), (-1, -1), (-2, -2), (-3, -3), (-4, -4),
-        (-5, -5), (-6, -6), (-7, -7)),
-    "rook": (
-        (1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (-1, 0), (-2, 0), (-3, 0), (-4, 0), (-5, 0), (-6, 0),
-        (-7, 0),
-        (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (0, 6), (0, 7), (0, -1), (0, -2), (0, -3), (0, -4), (0, -5), (0, -6),
-        (0, -7)),
-    "king": ((1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1), (2, 0), (-2, 0))
-}
-move_set["queen"] = tuple(list(move_set["bishop"]) + list(move_set["rook"]))
-
-pygame.display.set_mode(DISPLAY_SIZE, 0, 32)
-pygame.display.set_caption("PyChess")
-clock = pygame.time.Clock()
-display = pygame.Surface(DISPLAY_SIZE)
-screen = pygame.display.set_mode(WINDOW_SIZE, 0, 32)
-
 board_loc = [(DISPLAY_SIZE[0] - 128) // 2, (DISPLAY_SIZE[1] - 128) // 2]
-board = Board(pygame.image.load("data/chess_sprites/board.png").convert(), (DISPLAY_SIZE[0] - 128) // 2,
-              (DISPLAY_SIZE[1] - 128) // 2)
-
-bui = pygame.image.load("data/chess_sprites/promo_black.png").convert()
-bui.set_colorkey(PIECE_COLORKEY)
-wui = pygame.image.load("data/chess_sprites/promo_white.png").convert()
-wui.set_colorkey(PIECE_COLORKEY)
-ui = wui
-UI_LOC = [32, 30]
-UI_NAMES = ("bishop", "knight", "queen", "rook")
-UI_RECTS = {
-    "bishop": (),
-    "knight": (),
-    "queen": (),
-    "rook": ()
-}
-for y in range(2):
-    for x in range(2):
-        UI_RECTS[UI_NAMES[y * 2 + x]] = pygame.Rect((32 + 16 * x, 30 + 16 * y), (16, 16))
-
-clicked_piece = None
-drag = False
-
-hover_square = pygame.Surface((16, 16))
-hover_square.fill((255, 0, 0))
-hover_square.set_alpha(128)
-hover_square_loc = None
-
-og_square = pygame.Surface((16, 16))
-og_square.fill((0, 0, 255))
-og_square.set_alpha(128)
-og_square_loc = None
-
-ui_square = pygame.Surface((16, 16))
-ui_square.fill((128, 128, 0))
-ui_square.set_alpha(128)
-ui_square_loc = None
-
-full_screen = False
-running = True
-
-read_fen("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", board)
-
-while running:
-    display.fill((128, 128, 128))
-    mx, my = pygame.mouse.get_pos()
-    mx = mx * (DISPLAY_SIZE[0] / WINDOW_SIZE[0])
-    my = my * (DISPLAY_SIZE[1] / WINDOW_SIZE[1])
-    mouse_rect = pygame.Rect(mx, my, 1, 1)
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            pygame.quit()
-            sys.exit()
-        if event.type == MOUSEBUTTONDOWN:
-            if event.button == 1:
-                for piece in board.piece_list:
-                    if piece.rect.colliderect(mouse_rect) and piece.color == board.turn:
+SPRITES = SpriteAtlas()
+
+
+class DirtyRegions:
+    # display space rects that changed this frame, only those get redrawn, scaled and uploaded
+    def __init__(self, display_size, window_size):
+        self.bounds = pygame.Rect((0, 0), display_size)
+        self.scale = [Fraction(window, size) for window, size in zip(window_size, display_size)]
+        # rects are snapped to a grid of this many display pixels, which lands on whole window pixels, so a piece
+        # scaled on its own matches what scaling the whole surface would have given
+        self.grid = [scale.denominator for scale in self.scale]
+        self.rects = [self.bounds.copy()]
+        self.last = []
+
+    def add(self, rect):
+        self.rects.append(pygame.Rect(rect))
+
+    def track(self, rects):
+        # anything that moved, showed up or went away is dirty both where it was and where it is now
+        rects = [pygame.Rect(rect) for rect in rects if rect]
+        if rects != self.last:
+            self.rects += self.last + rects
+            self.last = rects
+
+    def flush(self, display, screen, draw):
+        areas = []
+        (grid_x, grid_y), (scale_x, scale_y) = self.grid, self.scale
+        for rect in self.rects:
+            left, top = rect.left // grid_x * grid_x, rect.top // grid_y * grid_y
+            right, bottom = -(-rect.right // grid_x) * grid_x, -(-rect.bottom // grid_y) * grid_y
+            rect = pygame.Rect(left, top, right - left, bottom - top).clip(self.bounds)
+            if not rect.w or not rect.h:
+                continue
+            for other in areas[:]:
+                if rect.colliderect(other):
+                    rect.union_ip(other)
+                    areas.remove(other)
+            areas.append(rect)
+        self.rects = []
+        if not areas:
+            return
+
+        updates = []
+        for rect in areas:
+            display.set_clip(rect)
+            draw()
+            left, top = int(rect.left * scale_x), int(rect.top * scale_y)
+            target = pygame.Rect(left, top, int(rect.right * scale_x) - left, int(rect.bottom * scale_y) - top)
+            screen.blit(pygame.transform.scale(display.subsurface(rect), target.size), target)
+            updates.append(target)
+        display.set_clip(None)
+        pygame.display.update(updates)
+
+
+class FrameProfiler:
+    # opt in timings per main loop phase plus call counts of the rules functions the ui leans on. phases are laps
+    # of the loop; time spent inside timed() functions is taken out of the lap it fell in and booked to their own
+    PHASES = ("events", "rules", "engine", "draw", "scale")
+    COUNTERS = {"legal_targets": "targets", "generate_legal_moves": "movegen", "make_move": "make_move",
+                "outcome": "outcome"}  # hud labels
+    HUD_EVERY = 0.5  # s between hud text refreshes, the hud itself shouldn't be most of what it measures
+
+    def __init__(self, enabled=False, history=100000):
+        self.enabled = enabled
+        self.frames = deque(maxlen=history)  # (frame ms, phase ms tuple, calls tuple)
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.calls = dict.fromkeys(self.COUNTERS, 0)
+        self.frame_start = self.last = time.perf_counter()
+        self.nested = 0.0  # timed() seconds since the last lap
+        self.depth = 0
+        self.font = None
+        self.hud = None
+        self.hud_rect = pygame.Rect(2, 66, 92, 112)
+        self.hud_time = 0.0
+
+    def timed(self, phase, func, counter=None):
+        if not self.enabled:
+            return func
+
+        def wrapper(*args, **kwargs):
+            if counter:
+                self.calls[counter] += 1
+            self.depth += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                if not self.depth:  # nested timed calls are already inside the outer one
+                    elapsed = time.perf_counter() - start
+                    self.nested += elapsed
+                    self.times[phase] += elapsed
+        return wrapper
+
+    def start_frame(self):
+        if self.enabled:
+            self.frame_start = self.last = time.perf_counter()
+            self.times = dict.fromkeys(self.PHASES, 0.0)
+            self.nested = 0.0
+
+    def lap(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.times[phase] += now - self.last - self.nested
+            self.last = now
+            self.nested = 0.0
+
+    def end_frame(self):
+        # -> hud rect when the hud text changed and needs redrawing
+        if not self.enabled:
+            return None
+        now = time.perf_counter()
+        self.frames.append(((now - self.frame_start) * 1000, tuple(self.times[phase] * 1000 for phase in self.PHASES),
+                            tuple(self.calls.values())))
+        if now - self.hud_time < self.HUD_EVERY:
+            return None
+        self.hud_time = now
+        self.hud = None
+        return self.hud_rect
+
+    def summary(self, frames=None):
+        frames = self.frames if frames is None else frames
+        totals = sorted(frame[0] for frame in frames)
+        summary = {"frames": len(totals), "mean": sum(totals) / max(len(totals), 1)}
+        for p in (50, 95, 99):
+            summary[f"p{p}"] = totals[min(len(totals) * p // 100, len(totals) - 1)] if totals else 0.0
+        return summary
+
+    def draw_hud(self, surface):
+        if not self.enabled:
+            return
+        if self.hud is None:
+            if self.font is None:
+                pygame.font.init()
+                self.font = pygame.font.Font(None, 11)
+            recent = list(self.frames)[-120:]
+            stats = self.summary(recent)
+            lines = [f"frame {recent[-1][0] if recent else 0:.2f} ms",
+                     f"p50 {stats['p50']:.1f} p95 {stats['p95']:.1f}", f"p99 {stats['p99']:.1f} ms"]
+            lines += [f"{phase} {ms:.2f}" for phase, ms in zip(self.PHASES, recent[-1][1] if recent else [0] * 5)]
+            lines += [f"{self.COUNTERS[name]} {count}" for name, count in self.calls.items()]
+            self.hud = pygame.Surface(self.hud_rect.size, SRCALPHA)
+            for i, line in enumerate(lines):
+                self.hud.blit(self.font.render(line, False, (255, 255, 255)), (0, i * 8))
+        surface.blit(self.hud, self.hud_rect)
+
+    def export(self, path):
+        # one row per frame, .json also carries the percentile summary
+        names = ["frame_ms"] + [f"{phase}_ms" for phase in self.PHASES] + list(self.COUNTERS)
+        rows = [[round(total, 4)] + [round(ms, 4) for ms in phases] + list(calls)
+                for total, phases, calls in self.frames]
+        with open(path, "w", newline="") as out:
+            if path.endswith(".json"):
+                json.dump({"summary": self.summary(), "frames": [dict(zip(names, row)) for row in rows]}, out)
+            else:
+                writer = csv.writer(out)
+                writer.writerow(names)
+                writer.writerows(rows)
+
+
+def square_at(x, y, origin, size=8):
+    # (file, rank) of the cell under a display point for a size x size grid drawn rank 0 at the bottom, None off it
+    file = int((x - origin[0]) // SQUARE_SIZE)
+    row = int((y - origin[1]) // SQUARE_SIZE)
+    if 0 <= file < size and 0 <= row < size:
+        return file, size - 1 - row
+    return None
+
+
+def legal_targets(board, pos, movegen=generate_legal_moves):
+    # every legal move of the piece on pos keyed by where it lands, worked out once when the piece is lifted
+    start = square(pos)
+    targets = {}
+    for move in movegen(board):
+        if move_start(move) == start:
+            targets.setdefault(square_pos(move_end(move)), []).append(move)
+    return targets
+
+
+def think(searcher, fen, moves, move_time, reply, book=None):
+    # searches a copy so the ui board is never touched off the main thread, the game's moves are replayed onto it so
+    # the search knows which positions already came up
+    board = Board()
+    read_fen(fen, board)
+    for move in moves:
+        board.make_move(move)
+    move = book.choose(board) if book is not None else 0
+    reply.append(move or searcher.search(board, time_limit=move_time)["move"])
+    pygame.event.post(pygame.event.Event(ENGINE_DONE))
+
+
+def game_over(board, check=outcome):
+    # checked after every move, the caption says how it ended
+    result = check(board)
+    if result is not None:
+        pygame.display.set_caption(f"PyChess - {result[0]} {result[1]}")
+    return result
+
+
+def next_events(busy, timeout):
+    # busy frames take what is queued and the frame cap paces them, idle ones sleep until something happens
+    if busy:
+        return pygame.event.get()
+    event = pygame.event.wait(timeout)
+    if event.type == NOEVENT:
+        return []
+    return [event] + pygame.event.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyChess")
+    parser.add_argument("--computer", choices=("white", "black"), help="colour the engine plays")
+    parser.add_argument("--move-time", type=float, default=2.0, help="engine seconds per move")
+    parser.add_argument("--book", help="polyglot opening book for the computer")
+    parser.add_argument("--full-redraw", action="store_true", help="redraw and upload the whole window every frame")
+    parser.add_argument("--fps", type=int, default=frame_rate, help="frame cap while dragging")
+    parser.add_argument("--idle-timeout", type=int, default=idle_timeout,
+                        help="ms to sleep waiting for input when nothing moves, 0 to never sleep")
+    parser.add_argument("--record", help="binary game archive to append the game to on exit")
+    parser.add_argument("--profile", action="store_true", help="show frame and phase timings in a hud")
+    parser.add_argument("--trace", help="write per frame timings to this .csv or .json on exit, implies --profile")
+    parser.add_argument("--assets", default=ASSET_PATH,
+                        help="sprite directory, its packed .pcar next to it is used instead when there is one")
+    args = parser.parse_args()
+
+    assets = open_assets(args.assets)
+    assets.preload()  # decodes in the background while the window comes up
+
+    pygame.init()
+    pygame.mixer.pre_init(44100, -16, 2, 512)  # freq, size, mono/stereo, buffer
+    pygame.mixer.set_num_channels(64)
+
+    WINDOW_SIZE = (pygame.display.Info().current_w // 16 * 13, pygame.display.Info().current_h // 9 * 7)
+    MONITOR_SIZE = (pygame.display.Info().current_w, pygame.display.Info().current_h)
+
+    pygame.display.set_mode(DISPLAY_SIZE, 0, 32)
+    pygame.display.set_caption("PyChess")
+    clock = pygame.time.Clock()
+    display = pygame.Surface(DISPLAY_SIZE)
+    screen = pygame.display.set_mode(WINDOW_SIZE, 0, 32)
+
+    SPRITES.load(assets)
+    board = Board()
+    board_image = assets.image("board.png")
+    promo = "queen"
+
+    bui = assets.image("promo_black.png")
+    bui.set_colorkey(PIECE_COLORKEY)
+    wui = assets.image("promo_white.png")
+    wui.set_colorkey(PIECE_COLORKEY)
+    ui = wui
+    UI_LOC = [32, 30]
+    UI_NAMES = ("bishop", "knight", "queen", "rook")
+    UI_RECTS = {
+        "bishop": (),
+        "knight": (),
+        "queen": (),
+        "rook": ()
+    }
+    for y in range(2):
+        for x in range(2):
+            UI_RECTS[UI_NAMES[y * 2 + x]] = pygame.Rect((32 + 16 * x, 30 + 16 * y), (16, 16))
+
+    clicked_piece = None
+    drag = False
+
+    hover_square = pygame.Surface((16, 16))
+    hover_square.fill((255, 0, 0))
+    hover_square.set_alpha(128)
+    hover_square_loc = None
+    hover_legal = False
+
+    legal_square = pygame.Surface((16, 16))
+    legal_square.fill((0, 255, 0))
+    legal_square.set_alpha(128)
+
+    hint_square = pygame.Surface((16, 16))
+    hint_square.fill((0, 255, 0))
+    hint_square.set_alpha(64)
+    targets = {}
+
+    og_square = pygame.Surface((16, 16))
+    og_square.fill((0, 0, 255))
+    og_square.set_alpha(128)
+    og_square_loc = None
+
+    ui_square = pygame.Surface((16, 16))
+    ui_square.fill((128, 128, 0))
+    ui_square.set_alpha(128)
+    ui_square_loc = None
+
+    full_screen = False
+    running = True
+    dirty = DirtyRegions(DISPLAY_SIZE, WINDOW_SIZE)
+    board_rect = pygame.Rect(board_loc, (128, 128))
+    ui_rect = pygame.Rect(UI_LOC, ui.get_size())
+
+    searcher = Searcher() if args.computer else None
+    book = OpeningBook(args.book) if args.computer and args.book else None
+    thinking = None
+    reply = []
+
+    read_fen(START_FEN, board)
+    record = GameRecord(write_fen(board), times=[])
+    started = time.perf_counter()
+
+    profiler = FrameProfiler(args.profile or bool(args.trace))
+    # the rules calls the ui makes, timed and counted with --profile; timed() hands them back untouched without it
+    movegen = profiler.timed("rules", generate_legal_moves, "generate_legal_moves")
+    find_targets = profiler.timed("rules", legal_targets, "legal_targets")
+    check_outcome = profiler.timed("rules", outcome, "outcome")
+    make_move = profiler.timed("rules", Board.make_move, "make_move")
+    sprites = board_sprites(board, board_loc)
+    result = None  # (score, reason) once the game has ended
+
+    def draw_scene():
+        display.fill((128, 128, 128))
+        display.blit(board_image, board_loc)
+        if og_square_loc is not None:
+            display.blit(og_square, og_square_loc)
+        for file, rank in targets:
+            display.blit(hint_square, (board_loc[0] + file * SQUARE_SIZE, board_loc[1] + (7 - rank) * SQUARE_SIZE))
+        if hover_square_loc is not None and hover_square_loc != og_square_loc:
+            display.blit(legal_square if hover_legal else hover_square, hover_square_loc)
+        for piece in sprites.values():
+            if not piece.drag:
+                piece.display(display)
+        if clicked_piece is not None:
+            clicked_piece.display(display, scaled=True)  # on top of everything it passes over
+
+        if ui_square_loc is not None:
+            display.blit(ui_square, ui_square_loc)
+        display.blit(ui, UI_LOC)
+
+        pygame.draw.rect(display, (255, 255, 255), mouse_rect)
+        profiler.draw_hud(display)
+
+    draw = profiler.timed("draw", draw_scene)
+
+    while running:
+        events = next_events(drag or not args.idle_timeout, args.idle_timeout)
+        mx, my = pygame.mouse.get_pos()
+        mx = mx * (DISPLAY_SIZE[0] / WINDOW_SIZE[0])
+        my = my * (DISPLAY_SIZE[1] / WINDOW_SIZE[1])
+        mouse_rect = pygame.Rect(mx, my, 1, 1)
+        profiler.start_frame()
+        for event in events:
+            if event.type == QUIT:
+                if args.record and len(record):
+                    with open(args.record, "ab") as out:
+                        out.write(record.to_bytes())
+                if args.trace:
+                    profiler.export(args.trace)
+                    print(" ".join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                                   for key, value in profiler.summary().items()))
+                pygame.quit()
+                sys.exit()
+            if event.type == VIDEOEXPOSE:
+                dirty.add(dirty.bounds)
+            if event.type == MOUSEBUTTONDOWN:
+                if event.button == 1:
+                    pos = square_at(mx, my, board_loc)
+                    piece = sprites.get(square(pos)) if pos is not None else None
+                    if piece is not None and piece.color == board.turn != args.computer and result is None:
                         centre_x = piece.rect.x + 8
                         centre_y = piece.rect.y + 8
                         piece.set_hold()
-                        piece.get_board_pos(board_loc, init=True)
                         og_square_loc = piece.hold
                         piece.offset = [piece.rect.x - 4 - centre_x, piece.rect.y - 4 - centre_y]
                         piece.x = mx
@@ -427,129 +502,83 @@ while running:
                         drag = True
                         piece.update()
                         clicked_piece = piece
-                for choice in UI_RECTS:
-                    if UI_RECTS[choice].colliderect(mouse_rect):
-                        board.promo = choice
-                        ui_square_loc = (UI_RECTS[choice].x, UI_RECTS[choice].y)
-
-        if event.type == MOUSEBUTTONUP:
-            if event.button == 1 and drag:
-                px = (mx - board.x) // 16
-                py = (my - board.y) // 16
-                pos = (int(px), int(abs(py - 7)))
-                result = clicked_piece.check_valid(pos, board)
-                if result["valid"]:
-                    board.cache = board.grid.copy(), board.piece_list.copy(), tuple(board.en_passant)
-                    board.grid[pos[1]][pos[0]] = board.grid[clicked_piece.pos[1]][clicked_piece.pos[0]]
-                    board.grid[clicked_piece.pos[1]][clicked_piece.pos[0]] = None
-
-                    if result["castle"] is not None:
-                        if result["castle"] == "right":
-                            rock = board.grid[pos[1]][0]
-                            rock.pos = (pos[0] + 1, pos[1])
-                            rock.x = board.x + px * 16 + 16
-                            rock.y = board.y + py * 16
-                            rock.update()
-                            rock = None
-                            board.grid[pos[1]][pos[0] + 1] = board.grid[pos[1]][0]
-                            board.grid[pos[1]][0] = None
-                        elif result["castle"] == "left":
-                            rock = board.grid[pos[1]][7]
-                            rock.pos = (pos[0] - 1, pos[1])
-                            rock.x = board.x + px * 16 - 16
-                            rock.y = board.y + py * 16
-                            rock.update()
-                            rock = None
-                            board.grid[pos[1]][pos[0] - 1] = board.grid[pos[1]][7]
-                            board.grid[pos[1]][7] = None
-
-                    elif result["passant"]:
-                        board.piece_list.remove(board.en_passant[1])
-                        board.grid[board.en_passant[1].pos[1]][board.en_passant[1].pos[0]] = None
-
-                    if not check_king(board, board.kings[board.turn], board.kings[board.turn].pos, target=None) and clicked_piece.type != "king":
-                            board.grid = board.cache[0]
-                            board.piece_list = board.cache[1]
-                            board.en_passant = board.cache[2]
-                            drag = False
-                            clicked_piece.drag = False
-                            clicked_piece.offset = [0, 0]
-                            clicked_piece.x = og_square_loc[0]
-                            clicked_piece.y = og_square_loc[1]
-                            hover_square_loc = None
-                            clicked_piece.update()
-                            clicked_piece = None
-
+                        targets = find_targets(board, pos, movegen)
+                        dirty.add(board_rect)
+                    cell = square_at(mx, my, UI_LOC, 2)
+                    if cell is not None:
+                        promo = UI_NAMES[(1 - cell[1]) * 2 + cell[0]]
+                        ui_square_loc = (UI_RECTS[promo].x, UI_RECTS[promo].y)
+
+            if event.type == MOUSEBUTTONUP:
+                if event.button == 1 and drag:
+                    moves = targets.get(square_at(mx, my, board_loc), ())
+                    if moves:
+                        # promotions come as four moves to one square, the ui choice picks between them
+                        move = next(move for move in moves if promotion_type(move) in (None, promo))
+                        make_move(board, move)
+                        record.add(move, (time.perf_counter() - started) * 1000)
+                        result = game_over(board, check_outcome)
+                        ui = bui if board.turn == "black" else wui
                     else:
-                        if result["target"] is not None:
-                            if result["target"].type == "rook":
-                                match result["target"].pos:
-                                    case (0, 0):
-                                        board.castle[0][1] = False
-                                    case (0, 7):
-                                        board.castle[0][0] = False
-                                    case (7, 0):
-                                        board.castle[1][1] = False
-                                    case (7, 7):
-                                        board.castle[1][0] = False
-                            board.piece_list.remove(result["target"])
-
-                        if result["promo"]:
-                            clicked_piece.type = board.promo
-                            clicked_piece.load_image()
-
-                        clicked_piece.pos = pos
-                        clicked_piece.moved = True
-                        board.full_move += 1
-
-                        if board.turn == 'white':
-                            board.turn = 'black'
-                            ui = bui
-                        else:
-                            board.turn = 'white'
-                            ui = wui
-
-                        if board.en_passant[1] != clicked_piece:
-                            board.en_passant = ([], None)
-
-                        drag = False
-                        clicked_piece.drag = False
-                        clicked_piece.offset = [0, 0]
-                        clicked_piece.x = board.x + px * 16
-                        clicked_piece.y = board.y + py * 16
-                        clicked_piece.update()
-                        clicked_piece = None
-
-                else:
+                        hover_square_loc = None
+                    targets = {}
                     drag = False
                     clicked_piece.drag = False
                     clicked_piece.offset = [0, 0]
-                    clicked_piece.x = og_square_loc[0]
-                    clicked_piece.y = og_square_loc[1]
-                    hover_square_loc = None
-                    clicked_piece.update()
                     clicked_piece = None
-
-        if event.type == MOUSEMOTION and drag:
-            clicked_piece.x = mx
-            clicked_piece.y = my
-            hover_square_loc = (int(board.x + ((mx - board.x) // 16) * 16), int(board.y + ((my - board.y) // 16) * 16))
-            clicked_piece.update()
-
-    display.blit(board.image, (board.x, board.y))
-    if og_square_loc is not None:
-        display.blit(og_square, og_square_loc)
-    if hover_square_loc is not None and hover_square_loc != og_square_loc:
-        display.blit(hover_square, hover_square_loc)
-    for piece in board.piece_list:
-        piece.display(display, scaled=piece.drag)
-
-    if ui_square_loc is not None:
-        display.blit(ui_square, ui_square_loc)
-    display.blit(ui, UI_LOC)
-
-    pygame.draw.rect(display, (255, 255, 255), mouse_rect)
-    scaled_display = pygame.transform.scale(display, WINDOW_SIZE)
-    screen.blit(scaled_display, (0, 0))
-    pygame.display.update()
-    clock.tick(frame_rate)
+                    sprites = board_sprites(board, board_loc)
+                    dirty.add(board_rect)
+                    dirty.add(ui_rect)
+
+            if event.type == MOUSEMOTION and drag:
+                clicked_piece.x = mx
+                clicked_piece.y = my
+                hover_square_loc = (int(board_loc[0] + ((mx - board_loc[0]) // 16) * 16), int(board_loc[1] + ((my - board_loc[1]) // 16) * 16))
+                hover_legal = square_at(mx, my, board_loc) in targets
+                clicked_piece.update()
+
+        profiler.lap("events")
+
+        if board.turn == args.computer and not drag and result is None:
+            if thinking is None:
+                reply.clear()
+                thinking = threading.Thread(target=think, daemon=True,
+                                            args=(searcher, record.fen, list(record.moves), args.move_time, reply,
+                                                  book))
+                thinking.start()
+            elif reply and reply[0]:
+                # a 0 reply means no legal moves, the dead thread is left in place so nothing restarts
+                thinking = None
+                make_move(board, reply[0])
+                record.add(reply[0], (time.perf_counter() - started) * 1000)
+                result = game_over(board, check_outcome)
+                ui = bui if board.turn == "black" else wui
+                og_square_loc = hover_square_loc = None
+                sprites = board_sprites(board, board_loc)
+                dirty.add(board_rect)
+                dirty.add(ui_rect)
+
+        profiler.lap("engine")
+
+        if args.full_redraw:
+            draw()
+            scaled_display = pygame.transform.scale(display, WINDOW_SIZE)
+            screen.blit(scaled_display, (0, 0))
+            pygame.display.update()
+        else:
+            dirty.track((
+                mouse_rect,
+                og_square_loc and (og_square_loc, (16, 16)),
+                hover_square_loc and hover_square_loc != og_square_loc and (hover_square_loc, (16, 16)),
+                ui_square_loc and (ui_square_loc, (16, 16)),
+                drag and (clicked_piece.rect.topleft, (24, 24))))
+            dirty.flush(display, screen, draw)
+        profiler.lap("scale")
+        hud_rect = profiler.end_frame()
+        if hud_rect is not None:
+            dirty.add(hud_rect)
+        clock.tick(args.fps if drag or not args.idle_timeout else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import sys
+import time
+
+from engine.movegen import generate_legal_moves, move_to_uci
+from engine.rules import START_FEN, Board, read_fen
+
+# name, fen, expected node counts for depth 1, 2, 3...
+REFERENCE_POSITIONS = (
+    ("start", START_FEN,
+     (20, 400, 8902, 197281, 4865609)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     (48, 2039, 97862, 4085603)),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     (14, 191, 2812, 43238, 674624)),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     (6, 264, 9467, 422333)),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     (44, 1486, 62379, 2103487)),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     (46, 2079, 89890, 3894594))
+)
+
+
+def load_board(fen):
+    board = Board()
+    read_fen(fen, board)
+    return board
+
+
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    moves = list(generate_legal_moves(board))
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board, depth):
+    counts = {}
+    for move in list(generate_legal_moves(board)):
+        board.make_move(move)
+        counts[move_to_uci(move)] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def run(fen, depth, show_divide=False):
+    board = load_board(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(board, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(board, depth)
+    elapsed = time.perf_counter() - start
+    if counts is not None:
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        print()
+    print(f"depth {depth}  nodes {nodes}  time {elapsed:.3f}s  nps {int(nodes / max(elapsed, 1e-9))}")
+    return nodes
+
+
+def run_suite(max_depth):
+    failed = 0
+    total_nodes = 0
+    total_time = 0
+    for name, fen, expected in REFERENCE_POSITIONS:
+        for depth, count in enumerate(expected[:max_depth], 1):
+            board = load_board(fen)
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == count else f"FAIL (expected {count})"
+            failed += nodes != count
+            print(f"{name:<12} depth {depth}  nodes {nodes:<9} {elapsed:8.3f}s  {status}")
+    print(f"\n{total_nodes} nodes in {total_time:.3f}s, {int(total_nodes / max(total_time, 1e-9))} nps, {failed} failed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="count move generation leaf nodes")
+    parser.add_argument("fen", nargs="?", default=START_FEN)
+    parser.add_argument("-d", "--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+    parser.add_argument("--suite", action="store_true", help="check the reference positions up to --depth")
+    args = parser.parse_args()
+    if args.suite:
+        sys.exit(1 if run_suite(args.depth) else 0)
+    run(args.fen, args.depth, args.divide)
@@ -0,0 +1,59 @@
+import argparse
+import mmap
+import sys
+import time
+
+from engine.movegen import move_to_uci
+from engine.pgn import play, read_games, san_to_move
+from engine.record import GameRecord, Replayer, read_records, write_records
+from engine.rules import START_FEN, parse_fen, write_fen
+
+
+def pgn_records(games, errors):
+    for tags, sans in games:
+        fen = tags.get("FEN", START_FEN)
+        try:
+            board = parse_fen(fen)
+            record = GameRecord(fen)
+            for san in sans:
+                move = san_to_move(board, san)
+                play(board, move)
+                record.add(move)
+        except ValueError as error:
+            errors.append(str(error))
+            continue
+        yield record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pack games into binary move logs and replay them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="convert a pgn collection")
+    pack.add_argument("pgn")
+    pack.add_argument("-o", "--output", default="games.pcg")
+    show = commands.add_parser("show", help="print a game's moves or the position at one ply")
+    show.add_argument("archive")
+    show.add_argument("game", type=int, nargs="?", default=0, help="index in the archive")
+    show.add_argument("--ply", type=int, help="print the fen after this many plies")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        start = time.perf_counter()
+        errors = []
+        with open(args.pgn, encoding="utf-8", errors="replace") as source, open(args.output, "wb") as out:
+            count = write_records(out, pgn_records(read_games(source), errors))
+        print(f"{count} games written to {args.output} in {time.perf_counter() - start:.3f}s, {len(errors)} skipped")
+    else:
+        with open(args.archive, "rb") as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for index, record in enumerate(read_records(data)):
+                if index == args.game:
+                    break
+            else:
+                sys.exit(f"no game {args.game} in {args.archive}")
+        if args.ply is None:
+            print(record.fen)
+            times = record.times or [None] * len(record)
+            for ply, (move, ms) in enumerate(zip(record.moves, times), 1):
+                print(f"{ply:<4} {move_to_uci(move):<6}" + (f" {ms / 1000:.1f}s" if ms is not None else ""))
+        else:
+            print(write_fen(Replayer(record).position(args.ply)))
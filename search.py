@@ -0,0 +1,61 @@
+import argparse
+import sys
+
+from engine.book import OpeningBook
+from engine.movegen import move_to_uci
+from engine.parallel import ParallelSearcher
+from engine.rules import START_FEN
+from engine.search import Searcher, format_score
+from engine.tablebase import Tablebases
+from perft import load_board
+
+
+def report(result):
+    print(f"depth {result['depth']:<3} score {format_score(result['score']):<10} nodes {result['nodes']:<9} "
+          f"time {result['time']:7.3f}s  nps {result['nps']:<7} pv {' '.join(result['pv'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="search a position and report depth and speed per iteration")
+    parser.add_argument("fen", nargs="?", default=START_FEN)
+    parser.add_argument("-d", "--depth", type=int, default=64)
+    parser.add_argument("-t", "--time", type=float, help="seconds for the move")
+    parser.add_argument("-n", "--nodes", type=int, help="node budget for the move")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="processes to split the root moves over")
+    parser.add_argument("--compare", action="store_true",
+                        help="search to --depth with one process and then --workers, and print the speedup")
+    parser.add_argument("--book", help="polyglot book to answer from before searching")
+    parser.add_argument("--tb", help="directory of endgame tables to probe during the search")
+    args = parser.parse_args()
+    if args.book:
+        with OpeningBook(args.book) as book:
+            move = book.choose(load_board(args.fen))
+        if move:
+            print(f"bestmove {move_to_uci(move)}  (book)")
+            sys.exit()
+    if args.compare and args.depth == 64:
+        parser.error("--compare times both searches to the same depth, give one with -d")
+    if args.workers > 1 and args.nodes is not None:
+        parser.error("--nodes is a single process budget, it can't be combined with --workers")
+    if args.time is None and args.nodes is None and args.depth == 64:
+        args.time = 5.0
+
+    if args.compare:
+        single = Searcher(args.hash, Tablebases(args.tb) if args.tb else None).search(load_board(args.fen), args.depth)
+        with ParallelSearcher(args.workers, args.hash, args.tb) as searcher:
+            split = searcher.search(load_board(args.fen), args.depth)
+        for name, result in (("1 process", single), (f"{args.workers} processes", split)):
+            print(f"{name:<12} depth {result['depth']}  bestmove {move_to_uci(result['move'])}  "
+                  f"score {format_score(result['score']):<10} nodes {result['nodes']:<9} time {result['time']:.3f}s")
+        print(f"speedup {single['time'] / max(split['time'], 1e-9):.2f}x")
+    else:
+        if args.workers > 1:
+            with ParallelSearcher(args.workers, args.hash, args.tb) as searcher:
+                result = searcher.search(load_board(args.fen), args.depth, args.time, info=report)
+        else:
+            tablebases = Tablebases(args.tb) if args.tb else None
+            result = Searcher(args.hash, tablebases).search(load_board(args.fen), args.depth, args.time, args.nodes,
+                                                            info=report)
+        print(f"bestmove {move_to_uci(result['move'])}  depth {result['depth']}  nodes {result['nodes']}  "
+              f"nps {result['nps']}")
@@ -0,0 +1,43 @@
+import argparse
+import os
+import time
+
+from engine.rules import parse_fen
+from engine.tablebase import BUILD_ORDER, MATE, TABLES, Tablebases, generate, write_table
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build or probe the three piece endgame tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="solve tables and write them as <name>.pctb")
+    build.add_argument("tables", nargs="*", help=f"any of {', '.join(TABLES)}, default all")
+    build.add_argument("-o", "--output", default="tables")
+    probe = commands.add_parser("probe", help="look a position up")
+    probe.add_argument("directory")
+    probe.add_argument("fen")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for name in args.tables:
+            if name not in TABLES:
+                parser.error(f"no table {name}, pick from {', '.join(TABLES)}")
+        os.makedirs(args.output, exist_ok=True)
+        names = set(args.tables or BUILD_ORDER)
+        if "KPK" in names:
+            names |= {"KQK", "KRK"}  # promotions are looked up in these
+        solved = {}
+        for name in sorted(names, key=BUILD_ORDER.index):
+            path = os.path.join(args.output, f"{name}.pctb")
+            start = time.perf_counter()
+            solved[name] = generate(name, solved)
+            write_table(solved[name], name, path)
+            print(f"{name} written to {path} in {time.perf_counter() - start:.1f}s")
+    else:
+        with Tablebases(args.directory) as tablebases:
+            score = tablebases.probe(parse_fen(args.fen))
+        if score is None:
+            print("not in the tables")
+        elif score == 0:
+            print("draw")
+        else:
+            plies = MATE - abs(score)
+            print(f"{'win' if score > 0 else 'loss'}, mate in {plies} plies ({(plies + 1) // 2} moves)")
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import sys
+
+from engine.book import OpeningBook
+from engine.movegen import move_from_uci, move_to_uci
+from engine.rules import START_FEN, Board, read_fen
+from engine.search import MAX_PLY, Searcher, format_score
+from engine.tablebase import Tablebases
+
+MOVES_TO_GO = 30  # assumed moves left when the clock comes without movestogo
+OVERHEAD = 0.05  # seconds kept back every move for the gui round trip
+GO_NUMBERS = ("wtime", "btime", "winc", "binc", "movestogo", "depth", "nodes", "movetime", "mate")
+
+
+def time_for_move(board, limits):
+    # seconds to think from the go limits, None means no clock
+    if "movetime" in limits:
+        return max(limits["movetime"] / 1000 - OVERHEAD, 0.01)
+    side = board.turn[0]
+    if f"{side}time" not in limits:
+        return None
+    left = limits[f"{side}time"] / 1000
+    moves_to_go = limits.get("movestogo", 0)
+    if moves_to_go <= 0:
+        moves_to_go = MOVES_TO_GO  # some guis send movestogo 0, taken as not given
+    budget = left / moves_to_go + limits.get(f"{side}inc", 0) / 1000 * 0.75
+    return max(min(budget, left - OVERHEAD), 0.01)
+
+
+async def read_lines():
+    # stdin through the event loop, so commands are seen while a search runs
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (NotImplementedError, OSError, ValueError):
+        # windows consoles and plain files can't be watched by the loop, a thread does the blocking reads
+        while line := await asyncio.to_thread(sys.stdin.readline):
+            yield line
+        return
+    while line := await reader.readline():
+        yield line.decode(errors="replace")
+
+
+class UciEngine:
+    def __init__(self, hash_mb=16, book=None, tablebases=None):
+        self.hash_mb = hash_mb
+        self.book = OpeningBook(book) if book else None
+        self.tablebases = Tablebases(tablebases) if tablebases else None
+        self.searcher = Searcher(hash_mb, self.tablebases)
+        self.board = self.new_board(START_FEN)
+        self.search = None  # task of the running go
+        self.released = None  # set by stop, "go infinite" holds its bestmove until then
+
+    def send(self, line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def new_board(self, fen):
+        board = Board()
+        read_fen(fen, board)
+        return board
+
+    async def halt(self):
+        task = self.search
+        if task is not None:
+            self.released.set()
+            while not task.done():
+                # repeated in case the thread hadn't started its clock yet, which clears the flag
+                self.searcher.stop()
+                await asyncio.wait({task}, timeout=0.005)
+
+    async def handle(self, line):
+        # one command line, False once the gui says quit
+        words = line.split()
+        if not words:
+            return True
+        match words[0]:
+            case "uci":
+                self.send("id name PyChess")
+                self.send("id author pygame-chess")
+                self.send(f"option name Hash type spin default {self.hash_mb} min 1 max 1024")
+                self.send("option name BookFile type string default <empty>")
+                self.send("option name TablebasePath type string default <empty>")
+                self.send("uciok")
+            case "isready":
+                self.send("readyok")
+            case "setoption":
+                await self.halt()
+                self.set_option(words)
+            case "ucinewgame":
+                await self.halt()
+                self.searcher = Searcher(self.hash_mb, self.tablebases)
+            case "position":
+                await self.halt()
+                self.set_position(words)
+            case "go":
+                await self.halt()
+                self.go(words)
+            case "stop":
+                await self.halt()
+            case "quit":
+                await self.halt()
+                return False
+        return True
+
+    def set_option(self, words):
+        if "name" not in words:
+            return
+        split = words.index("value") if "value" in words else len(words)
+        name = " ".join(words[words.index("name") + 1:split]).lower()
+        value = " ".join(words[split + 1:])
+        empty = value in ("", "<empty>")
+        try:
+            match name:
+                case "hash":
+                    self.hash_mb = max(int(value), 1)
+                    self.searcher = Searcher(self.hash_mb, self.tablebases)
+                case "bookfile":
+                    self.book = None if empty else OpeningBook(value)
+                case "tablebasepath":
+                    self.tablebases = None if empty else Tablebases(value)
+                    self.searcher.tablebases = self.tablebases
+        except (OSError, ValueError) as error:
+            self.send(f"info string {name}: {error}")
+
+    def set_position(self, words):
+        moves = words.index("moves") if "moves" in words else len(words)
+        fen = START_FEN if words[1:2] != ["fen"] else " ".join(words[2:moves])
+        try:
+            board = self.new_board(fen)
+            for text in words[moves + 1:]:
+                move = move_from_uci(board, text)
+                if move is None:
+                    raise ValueError(f"illegal move {text}")
+                board.make_move(move)
+        except (ValueError, IndexError) as error:
+            self.send(f"info string bad position: {error}")
+            return
+        self.board = board
+
+    def go(self, words):
+        limits = {}
+        for name, value in zip(words, words[1:]):
+            if name in GO_NUMBERS and value.lstrip("-").isdigit():
+                limits[name] = int(value)
+        if "mate" in limits:
+            limits.setdefault("depth", limits["mate"] * 2)
+        self.released = asyncio.Event()
+        self.search = asyncio.create_task(self.think(self.board, limits, "infinite" in words))
+
+    async def think(self, board, limits, infinite):
+        loop = asyncio.get_running_loop()
+
+        def info(result):
+            # called on the search thread, the loop does the writing
+            line = f"info depth {result['depth']} score {format_score(result['score'])} nodes {result['nodes']} " \
+                   f"nps {result['nps']} time {int(result['time'] * 1000)} pv {' '.join(result['pv'])}"
+            loop.call_soon_threadsafe(self.send, line)
+
+        move = self.book.choose(board) if self.book is not None and not infinite else 0
+        if not move:
+            # the board belongs to the search thread until it returns, position builds a new one
+            result = await asyncio.to_thread(self.searcher.search, board, limits.get("depth", MAX_PLY),
+                                             None if infinite else time_for_move(board, limits),
+                                             limits.get("nodes"), info)
+            move = result["move"]
+            if infinite:
+                await self.released.wait()
+        self.send(f"bestmove {move_to_uci(move) if move else '0000'}")
+        self.search = None
+
+
+async def run(engine):
+    async for line in read_lines():
+        if not await engine.handle(line):
+            break
+    await engine.halt()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="universal chess interface on stdin/stdout")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    parser.add_argument("--book", help="polyglot book to answer from before searching")
+    parser.add_argument("--tb", help="directory of endgame tables to probe during the search")
+    args = parser.parse_args()
+    asyncio.run(run(UciEngine(args.hash, args.book, args.tb)))